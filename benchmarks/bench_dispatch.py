@@ -0,0 +1,154 @@
+"""Нагрузочный тест отправки напоминаний
+
+Заполняет временную базу N пользователями и M напоминаниями (часть из них
+наступает в одну и ту же секунду), запускает ReminderChecker с FakeBot
+вместо Telegram и печатает пропускную способность, опоздание отправки
+относительно времени напоминания, время работы с базой и пик памяти.
+
+    python -m benchmarks.bench_dispatch --users 1000 --reminders 5000 --burst 2000
+    python -m benchmarks.bench_dispatch --save benchmarks/baseline.json
+    python -m benchmarks.bench_dispatch --baseline benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import resource
+import tempfile
+import time
+from typing import Dict, List
+
+import database
+import reminder_checker
+from benchmarks.fake_bot import FakeBot
+from benchmarks.report import load_baseline, percentile, print_results, save_results
+
+
+async def seed_database(users: int, reminders: int, burst: int, spread: float, start_at: int) -> Dict[str, int]:
+    """Создает напоминания и возвращает время наступления для каждого текста"""
+    due_times = {}
+    rows = []
+    now = int(time.time())
+
+    for i in range(reminders):
+        # Первые burst напоминаний наступают в одну секунду
+        remind_time = start_at if i < burst else start_at + int(random.uniform(0, spread))
+        text = f"bench {i}"
+        due_times[text] = remind_time
+        rows.append((random.randrange(users), text, remind_time, now, None))
+
+    await database.insert_reminders(rows)
+
+    return due_times
+
+
+def reminder_texts(message: str) -> List[str]:
+    """Тексты напоминаний в сообщении: одно напоминание или дайджест из нескольких"""
+    return [line.strip() for line in message.split('📝 ')[1:]]
+
+
+def timed(func, durations: List[float]):
+    """Оборачивает корутину и записывает время её выполнения"""
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            durations.append(time.perf_counter() - started)
+
+    return wrapper
+
+
+async def run_benchmark(args) -> Dict[str, float]:
+    start_at = int(time.time()) + 2
+    blocked_users = set(random.sample(range(args.users), int(args.users * args.blocked)))
+    due_times = await seed_database(args.users, args.reminders, args.burst, args.spread, start_at)
+    expected = len(due_times)
+
+    bot = FakeBot(latency=args.latency, flood_limit=args.flood_limit, blocked_users=blocked_users)
+    checker = reminder_checker.ReminderChecker('123456:BENCHMARK')
+    checker.bot = bot
+
+    claim_durations: List[float] = []
+    finish_durations: List[float] = []
+    reminder_checker.claim_pending_reminders = timed(reminder_checker.claim_pending_reminders, claim_durations)
+    reminder_checker.finish_claimed_reminders = timed(reminder_checker.finish_claimed_reminders, finish_durations)
+
+    task = asyncio.create_task(checker.start_checking(interval=args.interval))
+
+    delivered: List[float] = []
+    blocked = 0
+
+    def count_finished():
+        nonlocal blocked
+        delivered.clear()
+        for _, message, sent_at in bot.sent:
+            delivered.extend(sent_at - due_times[text] for text in reminder_texts(message))
+        blocked = sum(len(reminder_texts(message)) for message in bot.blocked_texts)
+        return len(delivered) + blocked
+
+    deadline = start_at + args.spread + args.timeout
+    while count_finished() < expected and time.time() < deadline:
+        await asyncio.sleep(0.1)
+
+    finished_at = time.time()
+    checker.stop_checking()
+    await task
+
+    count_finished()
+    lateness = delivered
+    duration = max(finished_at - start_at, 1e-9)
+
+    return {
+        'delivered': len(delivered),
+        'blocked': blocked,
+        'messages': len(bot.sent),
+        'flood_errors': bot.flood_errors,
+        'undelivered': expected - len(delivered) - blocked,
+        'throughput_msg_per_s': len(bot.sent) / duration,
+        'lateness_p50_s': percentile(lateness, 50),
+        'lateness_p99_s': percentile(lateness, 99),
+        'db_rounds': len(claim_durations),
+        'db_claim_ms_avg': sum(claim_durations) / max(len(claim_durations), 1) * 1000,
+        'db_finish_ms_avg': sum(finish_durations) / max(len(finish_durations), 1) * 1000,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест отправки напоминаний")
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--reminders', type=int, default=5000)
+    parser.add_argument('--burst', type=int, default=2000, help="сколько напоминаний наступает в одну секунду")
+    parser.add_argument('--spread', type=float, default=30, help="за сколько секунд наступают остальные")
+    parser.add_argument('--latency', type=float, default=0.05, help="задержка ответа Telegram, сек.")
+    parser.add_argument('--flood-limit', type=float, default=30, help="лимит сообщений в секунду у FakeBot")
+    parser.add_argument('--blocked', type=float, default=0.01, help="доля пользователей, заблокировавших бота")
+    parser.add_argument('--interval', type=int, default=60, help="интервал сверки расписания с базой")
+    parser.add_argument('--timeout', type=float, default=600, help="сколько ждать доставки после последнего напоминания")
+    parser.add_argument('--shards', type=int, default=1, help="на сколько файлов разделить базу")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--baseline', help="JSON с базовой линией для сравнения")
+    parser.add_argument('--save', help="записать результаты в JSON как базовую линию")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    random.seed(args.seed)
+
+    with tempfile.TemporaryDirectory() as directory:
+        database.DATABASE_PATH = os.path.join(directory, 'bench.db')
+        database.DATABASE_SHARDS = args.shards
+        database.init_database()
+        try:
+            results = asyncio.run(run_benchmark(args))
+        finally:
+            database.close_database()
+
+    print_results("Отправка напоминаний", results, load_baseline(args.baseline, 'dispatch'))
+    if args.save:
+        save_results(args.save, 'dispatch', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Нагрузочный тест создания напоминаний
+
+Запускает N одновременных "пользователей", каждый из которых создает
+напоминания через add_reminder, как это делает /remind, и печатает число
+вставок в секунду и задержку одного вызова. Размер пачки и время ожидания
+буфера можно менять, чтобы сравнить их с записью по одной строке.
+
+    python -m benchmarks.bench_insert --concurrency 200 --number 20000
+    python -m benchmarks.bench_insert --batch-size 1 --delay 0
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+import database
+from benchmarks.report import load_baseline, percentile, print_results, save_results
+
+
+async def run_benchmark(args) -> Dict[str, float]:
+    latencies: List[float] = []
+    remind_time = datetime.now() + timedelta(days=1)
+    per_user = args.number // args.concurrency
+
+    async def user(user_id: int):
+        for i in range(per_user):
+            started = time.perf_counter()
+            await database.add_reminder(user_id, f"bench {i}", remind_time)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(user_id) for user_id in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    return {
+        'inserts_per_second': len(latencies) / elapsed,
+        'latency_p50_ms': percentile(latencies, 50) * 1000,
+        'latency_p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест создания напоминаний")
+    parser.add_argument('--concurrency', type=int, default=200, help="одновременных пользователей")
+    parser.add_argument('--number', type=int, default=20000, help="всего напоминаний")
+    parser.add_argument('--batch-size', type=int, default=database.WRITE_BATCH_SIZE)
+    parser.add_argument('--delay', type=float, default=database.WRITE_BATCH_DELAY, help="ожидание буфера, секунды")
+    parser.add_argument('--shards', type=int, default=1, help="число файлов базы")
+    parser.add_argument('--baseline', help="JSON с базовой линией для сравнения")
+    parser.add_argument('--save', help="записать результаты в JSON как базовую линию")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    database.WRITE_BATCH_SIZE = args.batch_size
+    database.WRITE_BATCH_DELAY = args.delay
+
+    with tempfile.TemporaryDirectory() as directory:
+        database.DATABASE_PATH = os.path.join(directory, 'bench.db')
+        database.DATABASE_SHARDS = args.shards
+        database.init_database()
+        try:
+            results = asyncio.run(run_benchmark(args))
+        finally:
+            database.close_database()
+
+    print_results("Создание напоминаний", results, load_baseline(args.baseline, 'insert'))
+
+    if args.save:
+        save_results(args.save, 'insert', results)
+
+
+if __name__ == '__main__':
+    main()
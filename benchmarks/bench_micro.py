@@ -0,0 +1,91 @@
+"""Микробенчмарки парсера времени и обработчиков команд
+
+    python -m benchmarks.bench_micro
+    python -m benchmarks.bench_micro --save benchmarks/baseline.json
+    python -m benchmarks.bench_micro --baseline benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import logging
+import os
+import tempfile
+import time
+import timeit
+from types import SimpleNamespace
+from typing import Dict
+
+import database
+from benchmarks.report import load_baseline, print_results, save_results
+from time_parser import TEST_CORPUS, parse_time_tokens
+
+
+def bench_parser(number: int) -> Dict[str, float]:
+    """Время разбора одной команды из общего набора примеров"""
+    commands = [case.split() for case, _, _ in TEST_CORPUS]
+
+    def parse_all():
+        for tokens in commands:
+            parse_time_tokens(tokens)
+
+    seconds = min(timeit.repeat(parse_all, number=number, repeat=5))
+    return {'parse_time_tokens_us': seconds / (number * len(commands)) * 1e6}
+
+
+def _fake_update(user_id: int):
+    async def reply_text(*args, **kwargs):
+        pass
+
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id),
+        message=SimpleNamespace(reply_text=reply_text),
+    )
+
+
+async def bench_handlers(number: int) -> Dict[str, float]:
+    """Время обработки команд с реальной базой и заглушкой ответа"""
+    import main
+
+    results = {}
+    commands = {
+        'remind_command': (main.remind_command, ['через', '30', 'минут', 'Проверить', 'почту']),
+        'list_command': (main.list_command, []),
+    }
+
+    for name, (handler, args) in commands.items():
+        started = time.perf_counter()
+        for i in range(number):
+            await handler(_fake_update(i % 100), SimpleNamespace(args=args))
+        results[f'{name}_ms'] = (time.perf_counter() - started) / number * 1000
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарки парсера и обработчиков")
+    parser.add_argument('--number', type=int, default=2000)
+    parser.add_argument('--baseline', help="JSON с базовой линией для сравнения")
+    parser.add_argument('--save', help="записать результаты в JSON как базовую линию")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    parser_results = bench_parser(args.number)
+    print_results("Парсер времени", parser_results, load_baseline(args.baseline, 'parser'))
+
+    with tempfile.TemporaryDirectory() as directory:
+        database.DATABASE_PATH = os.path.join(directory, 'bench.db')
+        database.init_database()
+        try:
+            handler_results = asyncio.run(bench_handlers(args.number))
+        finally:
+            database.close_database()
+
+    print_results("Обработчики команд", handler_results, load_baseline(args.baseline, 'handlers'))
+
+    if args.save:
+        save_results(args.save, 'parser', parser_results)
+        save_results(args.save, 'handlers', handler_results)
+
+
+if __name__ == '__main__':
+    main()
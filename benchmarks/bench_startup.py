@@ -0,0 +1,95 @@
+"""Время холодного старта бота
+
+Измеряет, сколько занимает импорт main.py в новом процессе (за вычетом
+запуска самого интерпретатора) и init_database() на новой базе и на
+базе с актуальной схемой и rows напоминаниями — так бот перезапускается
+при выкладке.
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --rows 1000000 --save benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict
+
+import database
+from benchmarks.report import load_baseline, print_results, save_results
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _process_ms(code: str, repeat: int) -> float:
+    """Лучшее время запуска python -c code в новом процессе, миллисекунды"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - started)
+
+    return min(timings) * 1000
+
+
+def bench_imports(repeat: int) -> Dict[str, float]:
+    interpreter = _process_ms('pass', repeat)
+    return {
+        'interpreter_ms': interpreter,
+        'import_main_ms': _process_ms('import main', repeat) - interpreter,
+    }
+
+
+def _init_ms(repeat: int) -> float:
+    """Лучшее время init_database() на уже открытых заново соединениях"""
+    timings = []
+    for _ in range(repeat):
+        database.close_database()
+        started = time.perf_counter()
+        database.init_database()
+        timings.append(time.perf_counter() - started)
+
+    return min(timings) * 1000
+
+
+def bench_init_database(rows: int, repeat: int) -> Dict[str, float]:
+    with tempfile.TemporaryDirectory() as directory:
+        database.DATABASE_PATH = os.path.join(directory, 'bench.db')
+
+        started = time.perf_counter()
+        database.init_database()
+        results = {'init_new_db_ms': (time.perf_counter() - started) * 1000}
+
+        now = int(time.time())
+        batch = [(i % 1000, f"bench {i}", now + i, now, None) for i in range(rows)]
+        asyncio.run(database.insert_reminders(batch))
+
+        results['init_current_db_ms'] = _init_ms(repeat)
+        database.close_database()
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время холодного старта бота")
+    parser.add_argument('--rows', type=int, default=100000, help="напоминаний в базе")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--baseline', help="JSON с базовой линией для сравнения")
+    parser.add_argument('--save', help="записать результаты в JSON как базовую линию")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = bench_imports(args.repeat)
+    results.update(bench_init_database(args.rows, args.repeat))
+    print_results("Запуск бота", results, load_baseline(args.baseline, 'startup'))
+
+    if args.save:
+        save_results(args.save, 'startup', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""Имитация Telegram, отправляющего обновления на webhook бота
+
+Запустите бота с BOT_MODE=webhook и тем же WEBHOOK_SECRET, затем:
+
+    python -m benchmarks.bench_webhook --updates 2000 --concurrency 50
+    python -m benchmarks.bench_webhook --baseline benchmarks/baseline.json
+
+Скрипт отправляет POST запросы с обновлениями-командами, как это делает
+Telegram, проверяет, что запрос с неверным секретом отклоняется, и печатает
+пропускную способность и задержку приема обновлений.
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List, Tuple
+
+from benchmarks.report import load_baseline, percentile, print_results, save_results
+from config import WEBHOOK_LISTEN, WEBHOOK_PATH, WEBHOOK_PORT, WEBHOOK_SECRET
+
+COMMANDS = ['/help', '/list', '/remind через 30 минут Проверить почту']
+
+
+def make_update(update_id: int, user_id: int, text: str) -> Dict:
+    """Собирает обновление с командой в формате Bot API"""
+    command_length = len(text.split()[0])
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench'},
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': command_length}],
+        },
+    }
+
+
+async def post_update(host: str, port: int, path: str, secret: str, update: Dict) -> Tuple[int, float]:
+    """Отправляет обновление и возвращает код ответа и время ответа"""
+    body = json.dumps(update).encode('utf-8')
+    started = time.perf_counter()
+
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        writer.write(
+            f'POST /{path} HTTP/1.1\r\n'
+            f'Host: {host}:{port}\r\n'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'X-Telegram-Bot-Api-Secret-Token: {secret}\r\n'
+            f'Connection: close\r\n\r\n'.encode('latin-1') + body
+        )
+        await writer.drain()
+        status_line = await reader.readline()
+        await reader.read()
+    finally:
+        writer.close()
+
+    return int(status_line.split()[1]), time.perf_counter() - started
+
+
+async def run_benchmark(args) -> Dict[str, float]:
+    status, _ = await post_update(args.host, args.port, args.path, 'wrong-secret', make_update(0, 1, '/help'))
+    if status != 403:
+        print(f"⚠️ Запрос с неверным секретом вернул {status}, ожидался 403")
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def send(update_id: int):
+        nonlocal errors
+        update = make_update(update_id, update_id % args.users + 1, COMMANDS[update_id % len(COMMANDS)])
+        async with semaphore:
+            try:
+                status, latency = await post_update(args.host, args.port, args.path, args.secret, update)
+            except OSError:
+                errors += 1
+                return
+        if status == 200:
+            latencies.append(latency)
+        else:
+            errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(update_id) for update_id in range(1, args.updates + 1)))
+    duration = time.perf_counter() - started
+
+    return {
+        'accepted': len(latencies),
+        'errors': errors,
+        'updates_per_s': len(latencies) / duration,
+        'latency_p50_ms': percentile(latencies, 50) * 1000,
+        'latency_p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузка на webhook бота")
+    parser.add_argument('--host', default=WEBHOOK_LISTEN)
+    parser.add_argument('--port', type=int, default=WEBHOOK_PORT)
+    parser.add_argument('--path', default=WEBHOOK_PATH)
+    parser.add_argument('--secret', default=WEBHOOK_SECRET)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--baseline', help="JSON с базовой линией для сравнения")
+    parser.add_argument('--save', help="записать результаты в JSON как базовую линию")
+    args = parser.parse_args()
+
+    if not args.secret:
+        parser.error("нужен --secret или WEBHOOK_SECRET")
+
+    results = asyncio.run(run_benchmark(args))
+    print_results("Прием обновлений через webhook", results, load_baseline(args.baseline, 'webhook'))
+    if args.save:
+        save_results(args.save, 'webhook', results)
+
+
+if __name__ == '__main__':
+    main()
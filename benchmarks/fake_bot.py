@@ -0,0 +1,60 @@
+import asyncio
+import random
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from telegram.error import Forbidden, RetryAfter
+
+
+class FakeBot:
+    """Локальная замена telegram.Bot для нагрузочных тестов
+
+    Имитирует задержку сети, ограничение Telegram на число сообщений
+    в секунду (RetryAfter) и пользователей, заблокировавших бота.
+    """
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.02, flood_limit: Optional[float] = 30,
+                 retry_after: int = 1, blocked_users: Optional[Set[int]] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_limit = flood_limit
+        self.retry_after = retry_after
+        self.blocked_users = blocked_users or set()
+
+        # (chat_id, text, время отправки)
+        self.sent: List[Tuple[int, str, float]] = []
+        self.flood_errors = 0
+        self.blocked_errors = 0
+        # Тексты сообщений, не доставленных заблокировавшим бота
+        self.blocked_texts: List[str] = []
+        self._window: List[float] = []
+        self._chat_last_sent: Dict[int, float] = {}
+
+    def _over_limit(self, chat_id: int, now: float) -> bool:
+        if self.flood_limit is None:
+            return False
+
+        # Скользящее окно в одну секунду на весь бот
+        self._window = [sent_at for sent_at in self._window if now - sent_at < 1]
+        if len(self._window) >= self.flood_limit:
+            return True
+
+        # Не больше одного сообщения в секунду в один чат
+        return now - self._chat_last_sent.get(chat_id, 0.0) < 1
+
+    async def send_message(self, chat_id: int, text: str, parse_mode: Optional[str] = None, **kwargs):
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+        if chat_id in self.blocked_users:
+            self.blocked_errors += 1
+            self.blocked_texts.append(text)
+            raise Forbidden("Forbidden: bot was blocked by the user")
+
+        now = time.monotonic()
+        if self._over_limit(chat_id, now):
+            self.flood_errors += 1
+            raise RetryAfter(self.retry_after)
+
+        self._window.append(now)
+        self._chat_last_sent[chat_id] = now
+        self.sent.append((chat_id, text, time.time()))
@@ -0,0 +1,48 @@
+import json
+from typing import Dict, List, Optional
+
+
+def percentile(values: List[float], percent: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def print_results(title: str, results: Dict[str, float], baseline: Optional[Dict[str, float]] = None):
+    """Печатает результаты и, если есть, изменение относительно базовой линии"""
+    print(f"\n📊 {title}")
+    for name, value in results.items():
+        line = f"  {name:<32} {value:>12.4f}"
+        if baseline and baseline.get(name):
+            change = (value - baseline[name]) / baseline[name] * 100
+            line += f"   ({change:+.1f}% к базовой линии)"
+        print(line)
+
+
+def load_baseline(path: Optional[str], section: str) -> Optional[Dict[str, float]]:
+    if not path:
+        return None
+
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file).get(section)
+    except FileNotFoundError:
+        return None
+
+
+def save_results(path: str, section: str, results: Dict[str, float]):
+    """Записывает результаты в секцию JSON файла, сохраняя остальные секции"""
+    try:
+        with open(path, encoding='utf-8') as file:
+            data = json.load(file)
+    except FileNotFoundError:
+        data = {}
+
+    data[section] = results
+
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(data, file, ensure_ascii=False, indent=2)
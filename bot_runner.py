@@ -1,27 +1,15 @@
-import asyncio
-import logging
-from telegram.ext import Application
+"""Единая точка запуска: бот и чекер напоминаний в одном процессе
 
-from config import BOT_TOKEN
-from main import setup_handlers
-from database import init_database
-from reminder_checker import ReminderChecker, logger
+Application и ReminderChecker работают в одном event loop и используют
+один telegram.Bot с общим пулом HTTP соединений. При остановке чекер
+дожидается начатых отправок, пока соединения еще открыты.
+"""
+from main import main
 
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-logger = logging.getLogger(__name__)
 
-async def run_bot():
-    logging.info("Запускаем бота")
+def run_bot():
+    main()
 
-    init_database()
-
-    app = Application.builder().token(BOT_TOKEN).job_queue(None).build()
-
-    setup_handlers(app)
-
-    logger.info("Телеграмм бот готов к работе!")
-    await app.run_polling(drop_pending_updates=True)
 
+if __name__ == '__main__':
+    run_bot()
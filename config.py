@@ -4,4 +4,82 @@ from dotenv import load_dotenv
 load_dotenv()
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
-DATABASE_PATH = 'reminders.db'
\ No newline at end of file
+DATABASE_PATH = 'reminders.db'
+# На сколько файлов делить базу по user_id. При N > 1 файлы называются
+# reminders.0.db ... reminders.<N-1>.db; менять только вместе с rebalance.py
+DATABASE_SHARDS = int(os.getenv('DATABASE_SHARDS', '1'))
+
+# Порт HTTP сервера с метриками Prometheus (/metrics), 0 — выключено.
+# Боту и отдельно запущенному чекеру нужны разные порты
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+
+# Запускать ли чекер напоминаний в процессе бота. Выключите, если чекер
+# работает отдельным процессом (python reminder_checker.py)
+EMBEDDED_CHECKER = os.getenv('EMBEDDED_CHECKER', '1') == '1'
+
+# Новые напоминания записываются пачками: до WRITE_BATCH_SIZE строк одной
+# транзакцией. Первое напоминание ждет попутчиков не дольше WRITE_BATCH_DELAY
+# секунд; те, что пришли во время записи, попадают в следующую пачку
+WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', '200'))
+WRITE_BATCH_DELAY = float(os.getenv('WRITE_BATCH_DELAY', '0.002'))
+
+# Не больше RATE_LIMIT_REQUESTS команд от пользователя за RATE_LIMIT_WINDOW
+# секунд (0 — без ограничения). В памяти хранится не больше
+# RATE_LIMIT_MAX_USERS пользователей, давно неактивные забываются
+RATE_LIMIT_REQUESTS = int(os.getenv('RATE_LIMIT_REQUESTS', '30'))
+RATE_LIMIT_WINDOW = float(os.getenv('RATE_LIMIT_WINDOW', '60'))
+RATE_LIMIT_MAX_USERS = int(os.getenv('RATE_LIMIT_MAX_USERS', '100000'))
+# Сколько активных напоминаний может быть у одного пользователя, 0 — без ограничения
+MAX_ACTIVE_REMINDERS = int(os.getenv('MAX_ACTIVE_REMINDERS', '500'))
+
+# Обработки дольше TRACE_SLOW_MS миллисекунд пишутся в лог с разбивкой
+# по этапам (разбор, база, ответ), 0 — не писать
+TRACE_SLOW_MS = int(os.getenv('TRACE_SLOW_MS', '500'))
+
+# Telegram id администраторов через запятую: им доступна команда /profile
+ADMIN_IDS = {int(admin_id) for admin_id in os.getenv('ADMIN_IDS', '').split(',') if admin_id.strip()}
+# Профилировщик по /profile и SIGUSR1: длительность, период сэмплов и каталог для профилей
+PROFILE_SECONDS = int(os.getenv('PROFILE_SECONDS', '30'))
+PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', '300'))
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+
+# Как получать обновления: 'polling' или 'webhook'
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+# Сколько обновлений обрабатывать одновременно
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '64'))
+
+# Настройки режима webhook. WEBHOOK_URL — публичный https адрес, который
+# проксируется на WEBHOOK_LISTEN:WEBHOOK_PORT/WEBHOOK_PATH. WEBHOOK_SECRET
+# (символы A-Z, a-z, 0-9, _ и -) Telegram передает в заголовке каждого запроса
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+
+# Ограничения Telegram на отправку сообщений. Общий лимит Telegram — 30
+# сообщений в секунду, но задержка сети сдвигает моменты доставки, поэтому
+# отправляем с небольшим запасом: каждый RetryAfter останавливает всю отправку
+SEND_RATE_LIMIT = float(os.getenv('SEND_RATE_LIMIT', '28'))
+SEND_CHAT_INTERVAL = float(os.getenv('SEND_CHAT_INTERVAL', '1'))
+SEND_WORKERS = int(os.getenv('SEND_WORKERS', '8'))
+
+# Напоминания одного пользователя, захваченные вместе, отправляются одним
+# сообщением. Чекер ждет DIGEST_WINDOW секунд после наступления ближайшего
+# напоминания, чтобы в сообщение попали и наступившие чуть позже.
+# Отрицательное значение — отправлять каждое напоминание отдельно
+DIGEST_WINDOW = int(os.getenv('DIGEST_WINDOW', '0'))
+
+# Повторы неудачных отправок: задержка удваивается с каждой попыткой
+SEND_MAX_ATTEMPTS = int(os.getenv('SEND_MAX_ATTEMPTS', '5'))
+SEND_RETRY_DELAY = int(os.getenv('SEND_RETRY_DELAY', '60'))
+SEND_MAX_RETRY_DELAY = int(os.getenv('SEND_MAX_RETRY_DELAY', '3600'))
+
+# Отправленные и удаленные напоминания старше RETENTION_DAYS дней
+# переносятся из базы в CSV файл ARCHIVE_PATH, 0 — хранить в базе
+RETENTION_DAYS = int(os.getenv('RETENTION_DAYS', '30'))
+ARCHIVE_PATH = os.getenv('ARCHIVE_PATH', 'reminders_archive.csv')
+# Как часто запускать перенос в архив, секунды
+RETENTION_INTERVAL = int(os.getenv('RETENTION_INTERVAL', '3600'))
@@ -1,118 +1,1217 @@
+import asyncio
+import os
 import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import List, Tuple, Optional
+from itertools import chain
+from typing import Callable, Dict, List, Tuple, Optional
 
-DATABASE_PATH = 'reminders.db'
+from config import DATABASE_PATH, DATABASE_SHARDS, WRITE_BATCH_SIZE, WRITE_BATCH_DELAY, MAX_ACTIVE_REMINDERS
+from metrics import DB_QUERY_DURATION
+from time_parser import to_timestamp, next_remind_timestamp
 
+# Сколько строк переносить за одну транзакцию при миграции старой базы
+MIGRATION_BATCH_SIZE = 1000
 
-def upgrade_database():
-    """Обновляет структуру базы данных при необходимости"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+# Условия WHERE должны совпадать с условиями частичных индексов,
+# иначе SQLite не сможет их использовать
+ACTIVE_REMINDERS_QUERY = '''
+    SELECT id, text, remind_time, created_at, recurrence
+    FROM reminders
+    WHERE user_id = ? AND is_active = 1 AND is_sent = 0
+    ORDER BY remind_time, id
+'''
 
-    # Проверяем есть ли колонка is_sent
-    cursor.execute("PRAGMA table_info(reminders)")
-    columns = [column[1] for column in cursor.fetchall()]
+# Постраничный список: страница после (remind_time, id) и перед ним
+ACTIVE_REMINDERS_AFTER_QUERY = '''
+    SELECT id, text, remind_time, created_at, recurrence
+    FROM reminders
+    WHERE user_id = ? AND is_active = 1 AND is_sent = 0
+        AND (remind_time, id) > (?, ?)
+    ORDER BY remind_time, id
+    LIMIT ?
+'''
 
-    if 'is_sent' not in columns:
-        print("🔧 Добавляем колонку is_sent в существующую базу...")
-        cursor.execute('ALTER TABLE reminders ADD COLUMN is_sent BOOLEAN DEFAULT 0')
-        conn.commit()
-        print("✅ Колонка is_sent добавлена")
+ACTIVE_REMINDERS_BEFORE_QUERY = '''
+    SELECT id, text, remind_time, created_at, recurrence
+    FROM reminders
+    WHERE user_id = ? AND is_active = 1 AND is_sent = 0
+        AND (remind_time, id) < (?, ?)
+    ORDER BY remind_time DESC, id DESC
+    LIMIT ?
+'''
 
-    conn.close()
+# Для отложенных повторов время следующей попытки позже remind_time
+SCHEDULE_QUERY = '''
+    SELECT id, MAX(remind_time, COALESCE(next_attempt_at, 0))
+    FROM reminders
+    WHERE is_active = 1 AND is_sent = 0
+    ORDER BY remind_time
+    LIMIT ?
+'''
 
+PENDING_REMINDERS_QUERY = '''
+    SELECT id, user_id, text, remind_time
+    FROM reminders
+    WHERE remind_time <= ? AND is_active = 1 AND is_sent = 0
+        AND (next_attempt_at IS NULL OR next_attempt_at <= ?)
+    ORDER BY remind_time
+'''
 
-def init_database():
-    """Создает таблицу для напоминаний если её нет"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS reminders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            text TEXT NOT NULL,
-            remind_time TEXT NOT NULL,
-            created_at TEXT NOT NULL,
-            is_active BOOLEAN DEFAULT 1,
-            is_sent BOOLEAN DEFAULT 0
+# Напоминание можно захватить, если оно наступило, подошло время повтора
+# и оно не захвачено другим обработчиком, либо срок захвата истек (обработчик упал).
+# Выборка постраничная: (remind_time, id) больше последней захваченной строки
+CLAIM_REMINDERS_QUERY = '''
+    SELECT id, user_id, text, remind_time, recurrence
+    FROM reminders
+    WHERE remind_time <= ? AND is_active = 1 AND is_sent = 0
+        AND (remind_time, id) > (?, ?)
+        AND (next_attempt_at IS NULL OR next_attempt_at <= ?)
+        AND (claim_expires IS NULL OR claim_expires <= ?)
+    ORDER BY remind_time, id
+    LIMIT ?
+'''
+
+COUNT_ACTIVE_REMINDERS_QUERY = '''
+    SELECT COUNT(*)
+    FROM reminders
+    WHERE user_id = ? AND is_active = 1 AND is_sent = 0
+'''
+
+# Выгрузка всех активных напоминаний страницами по первичному ключу
+EXPORT_REMINDERS_QUERY = '''
+    SELECT id, user_id, text, remind_time, created_at, recurrence
+    FROM reminders
+    WHERE id > ? AND is_active = 1 AND is_sent = 0
+    ORDER BY id
+    LIMIT ?
+'''
+
+# Отправленные и удаленные напоминания, которые пора перенести в архив
+ARCHIVABLE_REMINDERS_QUERY = '''
+    SELECT id, user_id, text, remind_time, created_at, recurrence
+    FROM reminders
+    WHERE (is_active = 0 OR is_sent = 1) AND remind_time < ?
+    ORDER BY remind_time
+    LIMIT ?
+'''
+
+
+# Подписчики на изменения расписания, вызываются в потоке event loop
+# с (reminder_id, remind_time) при добавлении и (reminder_id, None) при удалении
+_schedule_listeners: List[Callable[[int, Optional[int]], None]] = []
+
+
+def add_schedule_listener(listener: Callable[[int, Optional[int]], None]):
+    """Подписывает на добавление и удаление напоминаний"""
+    _schedule_listeners.append(listener)
+
+
+def remove_schedule_listener(listener: Callable[[int, Optional[int]], None]):
+    """Отписывает от изменений расписания"""
+    if listener in _schedule_listeners:
+        _schedule_listeners.remove(listener)
+
+
+class ReminderLimitError(Exception):
+    """У пользователя уже максимальное число активных напоминаний"""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Достигнут лимит активных напоминаний: {limit}")
+        self.limit = limit
+
+
+def _notify_schedule(reminder_id: int, remind_time: Optional[int]):
+    for listener in list(_schedule_listeners):
+        listener(reminder_id, remind_time)
+
+
+def open_connection(path: str) -> sqlite3.Connection:
+    """Открывает соединение с файлом базы с настройками для бота"""
+    conn = sqlite3.connect(path, check_same_thread=False)
+    # Действует только на новую базу: освобожденные страницы можно вернуть
+    # системе через PRAGMA incremental_vacuum без полного VACUUM
+    conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+    # WAL позволяет читать параллельно с записью и уменьшает число fsync
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA busy_timeout=5000')
+
+    return conn
+
+
+def shard_paths(count: int) -> List[str]:
+    """Файлы базы при разбиении на count частей: reminders.db или reminders.0.db, reminders.1.db..."""
+    if count == 1:
+        return [DATABASE_PATH]
+
+    root, extension = os.path.splitext(DATABASE_PATH)
+    return [f'{root}.{index}{extension}' for index in range(count)]
+
+
+class Shard:
+    """Один файл базы со своим долгоживущим соединением и своим потоком
+
+    Все запросы из асинхронного кода выполняются в потоке файла, чтобы не
+    блокировать event loop, а запись в разные файлы не ждет одну блокировку.
+    """
+
+    def __init__(self, index: int, path: str):
+        self.index = index
+        self.path = path
+        self.connection: Optional[sqlite3.Connection] = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'database-{index}')
+        # Буфер add_reminder: строки и futures вызывающих, которые ждут свой id
+        self.pending_inserts: List[Tuple[Tuple, asyncio.Future]] = []
+        self.batch_full: Optional[asyncio.Event] = None
+        self.writer: Optional[asyncio.Task] = None
+
+    def get_connection(self) -> sqlite3.Connection:
+        """Возвращает соединение, открывая его при первом обращении"""
+        if self.connection is None:
+            self.connection = open_connection(self.path)
+
+        return self.connection
+
+    def close(self):
+        """Дожидается выполнения запросов в очереди и закрывает соединение"""
+        self.executor.shutdown(wait=True)
+
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+# Пользователи распределяются по DATABASE_SHARDS файлам по user_id.
+# Снаружи id напоминания — local_id * N + номер файла, по нему и находится файл.
+# При одном файле id совпадает с id в таблице
+_shards: List[Shard] = []
+
+
+def get_shards() -> List[Shard]:
+    """Возвращает файлы базы, создавая их описание при первом обращении"""
+    if not _shards:
+        _shards.extend(Shard(index, path) for index, path in enumerate(shard_paths(DATABASE_SHARDS)))
+
+    return _shards
+
+
+def shard_count() -> int:
+    """Число файлов, на которые разделена база"""
+    return len(get_shards())
+
+
+def _shard_for_user(user_id: int) -> Shard:
+    shards = get_shards()
+    return shards[user_id % len(shards)]
+
+
+def _shard_for_id(reminder_id: int) -> Shard:
+    shards = get_shards()
+    return shards[reminder_id % len(shards)]
+
+
+def _local_id(reminder_id: int) -> int:
+    return reminder_id // shard_count()
+
+
+def _global_id(shard: Shard, local_id: int) -> int:
+    return local_id * shard_count() + shard.index
+
+
+def _local_key(shard: Shard, key: Tuple[int, int]) -> Tuple[int, int]:
+    """Переводит ключ (remind_time, id) в ключ внутри файла с тем же порядком"""
+    remind_time, reminder_id = key
+    # Для строк этого файла id > reminder_id тогда и только тогда, когда local_id больше этого значения
+    return remind_time, (reminder_id - shard.index) // shard_count()
+
+
+def _global_rows(shard: Shard, rows: List[Tuple]) -> List[Tuple]:
+    """Заменяет id в первой колонке строк на внешний"""
+    if shard_count() == 1:
+        return rows
+
+    return [(_global_id(shard, row[0]), *row[1:]) for row in rows]
+
+
+def close_database():
+    """Дожидается выполнения запросов в очереди и закрывает соединения со всеми файлами"""
+    for shard in _shards:
+        shard.close()
+    _shards.clear()
+
+
+def _call(shard: Shard, func: Callable, args: tuple):
+    return func(shard.get_connection(), *args)
+
+
+async def _run(shard: Shard, func: Callable, *args):
+    """Выполняет функцию работы с базой в потоке файла базы"""
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    try:
+        return await loop.run_in_executor(shard.executor, _call, shard, func, args)
+    finally:
+        # Время включает ожидание в очереди потока базы — так его видит вызывающий код
+        DB_QUERY_DURATION.observe(time.perf_counter() - started, query=func.__name__.lstrip('_'))
+
+
+async def _run_all(func: Callable, *args) -> List:
+    """Выполняет функцию во всех файлах базы параллельно, результаты в порядке файлов"""
+    return await asyncio.gather(*(_run(shard, func, *args) for shard in get_shards()))
+
+
+# Колонки, появившиеся после первой версии схемы
+ADDED_COLUMNS = [
+    ('is_sent', 'BOOLEAN DEFAULT 0'),
+    ('claimed_by', 'TEXT'),
+    ('claim_expires', 'INTEGER'),
+    ('attempts', 'INTEGER DEFAULT 0'),
+    ('next_attempt_at', 'INTEGER'),
+    ('recurrence', 'TEXT'),
+]
+
+
+def _add_missing_columns(conn: sqlite3.Connection):
+    """Добавляет колонки, которых нет в базе, созданной старой версией бота"""
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(reminders)")]
+
+    for name, definition in ADDED_COLUMNS:
+        if name not in columns:
+            print(f"🔧 Добавляем колонку {name} в существующую базу...")
+            conn.execute(f'ALTER TABLE reminders ADD COLUMN {name} {definition}')
+
+
+# remind_time и created_at хранятся как UTC epoch секунды.
+# У повторяющегося напоминания recurrence — правило из time_parser,
+# а remind_time — время ближайшего срабатывания
+REMINDERS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        remind_time INTEGER NOT NULL,
+        created_at INTEGER NOT NULL,
+        is_active BOOLEAN DEFAULT 1,
+        is_sent BOOLEAN DEFAULT 0,
+        claimed_by TEXT,
+        claim_expires INTEGER,
+        attempts INTEGER DEFAULT 0,
+        next_attempt_at INTEGER,
+        recurrence TEXT
+    )
+'''
+
+# Напоминания, которые так и не удалось отправить за MAX попыток
+DEAD_REMINDERS_TABLE_SQL = '''
+    CREATE TABLE IF NOT EXISTS dead_reminders (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        remind_time INTEGER NOT NULL,
+        created_at INTEGER NOT NULL,
+        attempts INTEGER NOT NULL,
+        last_error TEXT,
+        failed_at INTEGER NOT NULL
+    )
+'''
+
+
+def _create_table(conn: sqlite3.Connection):
+    with conn:
+        conn.execute(REMINDERS_TABLE_SQL.format(table='reminders'))
+        conn.execute(DEAD_REMINDERS_TABLE_SQL)
+
+
+def _to_epoch(value) -> int:
+    if isinstance(value, int):
+        return value
+    return to_timestamp(datetime.fromisoformat(value))
+
+
+def _copy_epoch_batch(conn: sqlite3.Connection, batch_size: int) -> int:
+    """Переносит следующую пачку строк в новую таблицу, возвращает их количество"""
+    last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM reminders_epoch').fetchone()[0]
+
+    rows = conn.execute('''
+        SELECT id, user_id, text, remind_time, created_at, is_active, is_sent
+        FROM reminders
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?
+    ''', (last_id, batch_size)).fetchall()
+
+    conn.executemany('''
+        INSERT INTO reminders_epoch (id, user_id, text, remind_time, created_at, is_active, is_sent)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (reminder_id, user_id, text, _to_epoch(remind_time), _to_epoch(created_at), is_active, is_sent)
+        for reminder_id, user_id, text, remind_time, created_at, is_active, is_sent in rows
+    ])
+
+    return len(rows)
+
+
+def _has_legacy_time(conn: sqlite3.Connection) -> bool:
+    """Хранится ли время напоминаний в ISO строках, как до перехода на epoch"""
+    columns = {column[1]: column[2] for column in conn.execute("PRAGMA table_info(reminders)")}
+    return bool(columns) and columns['remind_time'].upper() != 'INTEGER'
+
+
+def _sync_copied_rows(conn: sqlite3.Connection):
+    """Переносит изменения, сделанные в уже скопированных строках во время миграции
+
+    Старая версия бота, которая еще работает, может отправить или удалить
+    напоминание после того, как его пачка скопирована. Без этого после
+    замены таблицы оно снова стало бы активным и ушло бы повторно.
+    """
+    conn.execute('''
+        UPDATE reminders_epoch
+        SET (is_active, is_sent) = (
+            SELECT is_active, is_sent FROM reminders WHERE reminders.id = reminders_epoch.id
+        )
+        WHERE EXISTS (
+            SELECT 1 FROM reminders
+            WHERE reminders.id = reminders_epoch.id
+                AND (reminders.is_active IS NOT reminders_epoch.is_active
+                     OR reminders.is_sent IS NOT reminders_epoch.is_sent)
         )
     ''')
+    conn.execute('DELETE FROM reminders_epoch WHERE id NOT IN (SELECT id FROM reminders)')
 
-    conn.commit()
-    conn.close()
-    print("База данных инициализирована")
 
-    # Обновляем существующую базу если нужно
-    upgrade_database()
+def _convert_to_epoch(conn: sqlite3.Connection, batch_size: int = MIGRATION_BATCH_SIZE):
+    """Переводит remind_time и created_at из ISO строк в UTC epoch секунды
 
+    Строки переносятся во временную таблицу небольшими транзакциями, чтобы
+    не держать блокировку записи на всё время миграции. Прерванная миграция
+    продолжается с места остановки при следующем запуске.
+    """
+    if not _has_legacy_time(conn):
+        return
 
-def add_reminder(user_id: int, text: str, remind_time: datetime) -> int:
-    """Добавляет новое напоминание в базу данных"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+    print("🔧 Переводим время напоминаний в UTC epoch...")
 
-    cursor.execute('''
-        INSERT INTO reminders (user_id, text, remind_time, created_at, is_active, is_sent)
-        VALUES (?, ?, ?, ?, 1, 0)
-    ''', (user_id, text, remind_time.isoformat(), datetime.now().isoformat()))
+    with conn:
+        # Колонки из старых версий нужны для переноса is_sent
+        _add_missing_columns(conn)
+        conn.execute(REMINDERS_TABLE_SQL.format(table='reminders_epoch'))
 
-    reminder_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    migrated = 0
+    while True:
+        with conn:
+            copied = _copy_epoch_batch(conn, batch_size)
+        if not copied:
+            break
+        migrated += copied
+
+    # Последнюю пачку и замену таблицы делаем в одной транзакции,
+    # чтобы не потерять строки, добавленные во время миграции
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        # Другой процесс мог закончить перенос, пока мы ждали блокировку
+        if _has_legacy_time(conn):
+            while _copy_epoch_batch(conn, batch_size):
+                pass
+            _sync_copied_rows(conn)
+            conn.execute('DROP TABLE reminders')
+            conn.execute('ALTER TABLE reminders_epoch RENAME TO reminders')
+
+    print(f"✅ Перенесено напоминаний: {migrated}")
+
+
+# is_active и is_sent включены в индексы, потому что SQLite считает
+# частичный индекс покрывающим только если в нём есть все колонки запроса
+INDEXES = {
+    'idx_reminders_due': '''
+        CREATE INDEX idx_reminders_due
+        ON reminders (remind_time, id, user_id, text, recurrence, next_attempt_at, claim_expires, is_active, is_sent)
+        WHERE is_active = 1 AND is_sent = 0
+    ''',
+    'idx_reminders_user': '''
+        CREATE INDEX idx_reminders_user
+        ON reminders (user_id, remind_time, id, text, created_at, recurrence, is_active, is_sent)
+        WHERE is_active = 1 AND is_sent = 0
+    ''',
+    # Маленький индекс для задачи хранения: в него попадают только
+    # отправленные и удаленные строки
+    'idx_reminders_done': '''
+        CREATE INDEX idx_reminders_done
+        ON reminders (remind_time)
+        WHERE is_active = 0 OR is_sent = 1
+    ''',
+}
+
+
+def _normalize_sql(sql: str) -> str:
+    return ' '.join(sql.split())
+
+
+def _create_indexes(conn: sqlite3.Connection):
+    """Создает частичные покрывающие индексы под выборку наступивших
+    напоминаний и под список напоминаний пользователя.
+    Индекс с изменившимся определением пересоздается."""
+    existing = dict(conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND tbl_name = 'reminders'"
+    ))
+
+    for name, sql in INDEXES.items():
+        sql = _normalize_sql(sql)
+        if name in existing and _normalize_sql(existing[name] or '') == sql:
+            continue
+
+        if name in existing:
+            print(f"🔧 Пересоздаем индекс {name}...")
+            conn.execute(f'DROP INDEX {name}')
+        conn.execute(sql)
+
+
+def _migration_base_schema(conn: sqlite3.Connection):
+    """Таблицы напоминаний и недоставленных напоминаний"""
+    conn.execute(REMINDERS_TABLE_SQL.format(table='reminders'))
+    conn.execute(DEAD_REMINDERS_TABLE_SQL)
+    # Базы, созданные до версий схемы, могут быть без поздних колонок.
+    # Время в ISO строках migrate() переводит в epoch до этой транзакции
+    _add_missing_columns(conn)
+
+
+def _migration_indexes(conn: sqlite3.Connection):
+    """Частичные покрывающие индексы"""
+    _create_indexes(conn)
+
+
+# Версия схемы хранится в PRAGMA user_version: миграция с номером N
+# (с единицы) переводит базу из версии N - 1 в N. Новые изменения
+# схемы добавляются только в конец списка
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _migration_base_schema,
+    _migration_indexes,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def _schema_version(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> bool:
+    """Доводит схему базы до SCHEMA_VERSION, возвращает, были ли миграции
+
+    Для актуальной базы это чтение заголовка файла и проверка индексов.
+    Иначе недостающие миграции выполняются по порядку в одной транзакции
+    вместе с записью новой версии: при ошибке база остается в прежней
+    версии. Перенос старой базы на epoch идет до нее своими пачками.
+    """
+    migrated = False
+    if _schema_version(conn) < SCHEMA_VERSION:
+        _convert_to_epoch(conn)
+        migrated = _apply_migrations(conn)
+
+    # Индексы могли остаться удаленными после прерванного офлайн-импорта
+    with conn:
+        _create_indexes(conn)
+
+    return migrated
+
+
+def _apply_migrations(conn: sqlite3.Connection) -> bool:
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Другой процесс мог закончить миграцию, пока мы ждали блокировку
+        version = _schema_version(conn)
+        for number in range(version + 1, SCHEMA_VERSION + 1):
+            migration = MIGRATIONS[number - 1]
+            print(f"🔧 Миграция {number}: {migration.__doc__}")
+            migration(conn)
+
+        conn.execute(f'PRAGMA user_version = {max(version, SCHEMA_VERSION)}')
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    return version < SCHEMA_VERSION
+
+
+def drop_indexes():
+    """Удаляет индексы таблицы напоминаний
+
+    Только для обслуживания при остановленном боте: массовая вставка
+    без индексов с последующим create_indexes() в разы быстрее, чем
+    обновление индексов на каждую строку.
+    """
+    for shard in get_shards():
+        conn = shard.get_connection()
+        with conn:
+            for name in INDEXES:
+                conn.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+def create_indexes():
+    """Создает индексы, удаленные drop_indexes()"""
+    for shard in get_shards():
+        conn = shard.get_connection()
+        with conn:
+            _create_indexes(conn)
+
+
+def init_database():
+    """Создает или обновляет схему во всех файлах базы"""
+    for shard in get_shards():
+        migrate(shard.get_connection())
+
+    if shard_count() > 1:
+        print(f"База данных инициализирована, файлов: {shard_count()}")
+    else:
+        print("База данных инициализирована")
+
+
+async def _write_inserts(shard: Shard):
+    """Записывает буфер add_reminder пачками, пока он не опустеет
+
+    Каждая пачка — одна транзакция, поэтому одновременные /remind ждут
+    одну запись вместо очереди из отдельных транзакций.
+    """
+    try:
+        if WRITE_BATCH_DELAY > 0 and len(shard.pending_inserts) < WRITE_BATCH_SIZE:
+            try:
+                await asyncio.wait_for(shard.batch_full.wait(), WRITE_BATCH_DELAY)
+            except asyncio.TimeoutError:
+                pass
+
+        while shard.pending_inserts:
+            batch = shard.pending_inserts[:WRITE_BATCH_SIZE]
+            del shard.pending_inserts[:WRITE_BATCH_SIZE]
+
+            try:
+                local_ids = await _run(shard, _insert_reminders, [row for row, _ in batch], MAX_ACTIVE_REMINDERS)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), local_id in zip(batch, local_ids):
+                if future.done():
+                    continue
+                if local_id is None:
+                    future.set_exception(ReminderLimitError(MAX_ACTIVE_REMINDERS))
+                else:
+                    future.set_result(_global_id(shard, local_id))
+    finally:
+        shard.writer = None
+
+
+async def add_reminder(user_id: int, text: str, remind_time: datetime, recurrence: Optional[str] = None) -> int:
+    """Добавляет новое напоминание в базу данных
+
+    Для повторяющегося напоминания recurrence — правило повторения,
+    а remind_time — время первого срабатывания. Запись идет через буфер
+    файла базы вместе с напоминаниями других пользователей. Если у
+    пользователя уже MAX_ACTIVE_REMINDERS активных напоминаний,
+    выбрасывает ReminderLimitError.
+    """
+    shard = _shard_for_user(user_id)
+    row = (user_id, text, to_timestamp(remind_time), int(time.time()), recurrence)
+    future = asyncio.get_running_loop().create_future()
+    shard.pending_inserts.append((row, future))
+
+    if shard.writer is None:
+        shard.batch_full = asyncio.Event()
+        shard.writer = asyncio.create_task(_write_inserts(shard))
+    elif len(shard.pending_inserts) >= WRITE_BATCH_SIZE:
+        shard.batch_full.set()
+
+    reminder_id = await future
+    _notify_schedule(reminder_id, row[2])
 
     return reminder_id
 
 
-def get_active_reminders(user_id: int) -> List[Tuple]:
+def _insert_reminders(conn: sqlite3.Connection, rows: List[Tuple], max_active: int = 0) -> List[Optional[int]]:
+    with conn:
+        # Внутри одной транзакции записи нет конкурентов, поэтому
+        # AUTOINCREMENT выдает строкам пачки подряд идущие id,
+        # а лимит не обойти параллельными пачками
+        conn.execute('BEGIN IMMEDIATE')
+
+        accepted = [True] * len(rows)
+        if max_active > 0:
+            free = {
+                user_id: max_active - conn.execute(COUNT_ACTIVE_REMINDERS_QUERY, (user_id,)).fetchone()[0]
+                for user_id in {row[0] for row in rows}
+            }
+            for position, row in enumerate(rows):
+                accepted[position] = free[row[0]] > 0
+                free[row[0]] -= 1
+
+        inserted = [row for row, ok in zip(rows, accepted) if ok]
+        conn.executemany('''
+            INSERT INTO reminders (user_id, text, remind_time, created_at, is_active, is_sent, recurrence)
+            VALUES (?, ?, ?, ?, 1, 0, ?)
+        ''', inserted)
+        last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+
+    local_ids = iter(range(last_id - len(inserted) + 1, last_id + 1))
+    return [next(local_ids) if ok else None for ok in accepted]
+
+
+async def insert_reminders(rows: List[Tuple], max_active: int = 0) -> List[Optional[int]]:
+    """Добавляет пачку напоминаний одной транзакцией
+
+    Каждая строка — (user_id, text, remind_time, created_at, recurrence),
+    время в UTC epoch секундах. Возвращает id добавленных напоминаний
+    в порядке строк. Если max_active > 0, строки пользователей, у которых
+    уже столько активных напоминаний, не добавляются и получают None.
+    """
+    if not rows:
+        return []
+
+    # Позиции строк в rows для каждого файла базы
+    positions: Dict[int, List[int]] = {}
+    for position, row in enumerate(rows):
+        positions.setdefault(_shard_for_user(row[0]).index, []).append(position)
+
+    shards = get_shards()
+    results = await asyncio.gather(*(
+        _run(shards[index], _insert_reminders, [rows[position] for position in shard_positions], max_active)
+        for index, shard_positions in positions.items()
+    ))
+
+    reminder_ids: List[Optional[int]] = [None] * len(rows)
+    for (index, shard_positions), local_ids in zip(positions.items(), results):
+        for position, local_id in zip(shard_positions, local_ids):
+            if local_id is not None:
+                reminder_ids[position] = _global_id(shards[index], local_id)
+
+    for reminder_id, row in zip(reminder_ids, rows):
+        if reminder_id is not None:
+            _notify_schedule(reminder_id, row[2])
+
+    return reminder_ids
+
+
+def _get_active_reminders(conn: sqlite3.Connection, user_id: int) -> List[Tuple]:
+    cursor = conn.execute(ACTIVE_REMINDERS_QUERY, (user_id,))
+
+    return cursor.fetchall()
+
+
+async def get_active_reminders(user_id: int) -> List[Tuple]:
     """Получает все активные напоминания пользователя"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+    shard = _shard_for_user(user_id)
+    return _global_rows(shard, await _run(shard, _get_active_reminders, user_id))
 
-    cursor.execute('''
-        SELECT id, text, remind_time, created_at
-        FROM reminders 
-        WHERE user_id = ? AND is_active = 1 AND is_sent = 0
-        ORDER BY remind_time
-    ''', (user_id,))
 
-    reminders = cursor.fetchall()
-    conn.close()
+def _get_active_reminders_page(conn: sqlite3.Connection, user_id: int, limit: int,
+                               after: Optional[Tuple[int, int]],
+                               before: Optional[Tuple[int, int]]) -> Tuple[List[Tuple], bool, bool]:
+    # Берем на одну строку больше, чтобы узнать, есть ли следующая страница
+    if before is not None:
+        rows = conn.execute(ACTIVE_REMINDERS_BEFORE_QUERY, (user_id, *before, limit + 1)).fetchall()
+        has_prev = len(rows) > limit
+        return list(reversed(rows[:limit])), has_prev, True
 
-    return reminders
+    rows = conn.execute(ACTIVE_REMINDERS_AFTER_QUERY, (user_id, *(after or (-1, -1)), limit + 1)).fetchall()
+    return rows[:limit], after is not None, len(rows) > limit
 
 
-def delete_reminder(reminder_id: int, user_id: int) -> bool:
-    """Помечает напоминание как отправленное"""
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+async def get_active_reminders_page(user_id: int, limit: int,
+                                    after: Optional[Tuple[int, int]] = None,
+                                    before: Optional[Tuple[int, int]] = None) -> Tuple[List[Tuple], bool, bool]:
+    """Получает страницу активных напоминаний пользователя
 
-    cursor.execute('''
-        UPDATE reminders 
-        SET is_sent = 1 
-        WHERE id = ? AND user_id = ?
-    ''', (reminder_id, user_id))
+    Страница начинается после (remind_time, id) из after или заканчивается
+    перед before; без них возвращается первая страница.
+    Возвращает (напоминания, есть ли предыдущая страница, есть ли следующая).
+    """
+    shard = _shard_for_user(user_id)
+    rows, has_prev, has_next = await _run(
+        shard, _get_active_reminders_page, user_id, limit,
+        after and _local_key(shard, after), before and _local_key(shard, before)
+    )
 
-    success = cursor.rowcount > 0
-    conn.commit()
-    conn.close()
+    return _global_rows(shard, rows), has_prev, has_next
+
+
+def _count_active_reminders(conn: sqlite3.Connection, user_id: int) -> int:
+    return conn.execute(COUNT_ACTIVE_REMINDERS_QUERY, (user_id,)).fetchone()[0]
+
+
+async def count_active_reminders(user_id: int) -> int:
+    """Считает активные напоминания пользователя"""
+    return await _run(_shard_for_user(user_id), _count_active_reminders, user_id)
+
+
+def _export_reminders_page(conn: sqlite3.Connection, after_id: int, limit: int) -> List[Tuple]:
+    return conn.execute(EXPORT_REMINDERS_QUERY, (after_id, limit)).fetchall()
+
+
+async def export_reminders_page(after_id: int, limit: int) -> List[Tuple]:
+    """Получает страницу активных напоминаний всех пользователей
+
+    Возвращает (id, user_id, text, remind_time, created_at, recurrence)
+    с id больше after_id в порядке id.
+    """
+    pages = await asyncio.gather(*(
+        _run(shard, _export_reminders_page, _local_key(shard, (0, after_id))[1], limit)
+        for shard in get_shards()
+    ))
+
+    rows = chain.from_iterable(_global_rows(shard, page) for shard, page in zip(get_shards(), pages))
+    return sorted(rows)[:limit]
+
+
+def _delete_reminder(conn: sqlite3.Connection, reminder_id: int, user_id: int) -> bool:
+    with conn:
+        cursor = conn.execute('''
+            UPDATE reminders 
+            SET is_sent = 1 
+            WHERE id = ? AND user_id = ?
+        ''', (reminder_id, user_id))
+
+    return cursor.rowcount > 0
+
+
+async def delete_reminder(reminder_id: int, user_id: int) -> bool:
+    """Помечает напоминание как отправленное"""
+    success = await _run(_shard_for_id(reminder_id), _delete_reminder, _local_id(reminder_id), user_id)
+    if success:
+        _notify_schedule(reminder_id, None)
 
     return success
 
 
-def get_pending_reminders() -> List[Tuple]:
-    """Получает все напоминания, время которых наступило"""
-    with sqlite3.connect(DATABASE_PATH) as conn:
-        cursor = conn.cursor()
+def _get_pending_reminders(conn: sqlite3.Connection) -> List[Tuple]:
+    current_time = int(time.time())
+
+    cursor = conn.execute(PENDING_REMINDERS_QUERY, (current_time, current_time))
+
+    return cursor.fetchall()
+
+
+async def get_pending_reminders() -> List[Tuple]:
+    """Получает все напоминания, время которых наступило и которые можно отправлять"""
+    pages = await _run_all(_get_pending_reminders)
+    rows = chain.from_iterable(_global_rows(shard, page) for shard, page in zip(get_shards(), pages))
+
+    return sorted(rows, key=lambda row: row[3])
+
+
+def _count_pending_reminders(conn: sqlite3.Connection) -> int:
+    current_time = int(time.time())
+    return conn.execute(
+        'SELECT COUNT(*) FROM reminders WHERE remind_time <= ? AND is_active = 1 AND is_sent = 0',
+        (current_time,)
+    ).fetchone()[0]
+
+
+async def count_pending_reminders() -> int:
+    """Считает наступившие, но не отправленные напоминания"""
+    return sum(await _run_all(_count_pending_reminders))
+
+
+def _claim_pending_reminders(conn: sqlite3.Connection, worker_id: str, lease_seconds: int,
+                             limit: int, after: Tuple[int, int]) -> List[Tuple]:
+    now = int(time.time())
+
+    with conn:
+        # IMMEDIATE сразу берет блокировку записи, поэтому два обработчика
+        # не могут выбрать одни и те же строки
+        conn.execute('BEGIN IMMEDIATE')
+        rows = conn.execute(CLAIM_REMINDERS_QUERY, (now, *after, now, now, limit)).fetchall()
+        conn.executemany('''
+            UPDATE reminders
+            SET claimed_by = ?, claim_expires = ?
+            WHERE id = ?
+        ''', [(worker_id, now + lease_seconds, row[0]) for row in rows])
+
+    return rows
+
+
+async def claim_pending_reminders(worker_id: str, lease_seconds: int, limit: int,
+                                  after: Tuple[int, int] = (-1, -1), shard: int = 0) -> List[Tuple]:
+    """Захватывает пачку наступивших напоминаний за обработчиком на lease_seconds секунд
+
+    Возвращает (id, user_id, text, remind_time) захваченных напоминаний
+    в порядке (remind_time, id). Чтобы получить следующую страницу, передайте
+    в after (remind_time, id) последнего из них. Если обработчик не отметит
+    напоминания отправленными до истечения срока, их сможет захватить другой.
+
+    Напоминания захватываются из одного файла базы с номером shard, у каждого
+    файла свой обход — их можно вести параллельно для всех shard_count() файлов.
+    """
+    target = get_shards()[shard]
+    rows = await _run(target, _claim_pending_reminders, worker_id, lease_seconds, limit, _local_key(target, after))
+
+    return _global_rows(target, rows)
+
+
+def _release_claims(conn: sqlite3.Connection, worker_id: str, lease_seconds: int) -> int:
+    # Захваченные строки наступили не позже чем lease_seconds назад от истечения
+    # захвата, поэтому достаточно пройти по индексу наступивших напоминаний
+    with conn:
+        cursor = conn.execute('''
+            UPDATE reminders
+            SET claimed_by = NULL, claim_expires = NULL
+            WHERE remind_time <= ? AND is_active = 1 AND is_sent = 0 AND claimed_by = ?
+        ''', (int(time.time()) + lease_seconds, worker_id))
+
+    return cursor.rowcount
+
+
+async def release_claims(worker_id: str, lease_seconds: int) -> int:
+    """Снимает захват с напоминаний, которые обработчик так и не отправил
+
+    Вызывается при остановке, чтобы следующий запуск не ждал истечения
+    захвата. Возвращает число освобожденных напоминаний.
+    """
+    return sum(await _run_all(_release_claims, worker_id, lease_seconds))
+
+
+# Сколько id передавать в одном запросе с IN: SQLite ограничивает число параметров
+IN_QUERY_BATCH = 500
+
+
+def _finish_claimed_reminders(conn: sqlite3.Connection, worker_id: str,
+                              sent_ids: List[int], rescheduled: List[Tuple[int, int]],
+                              failed: List[Tuple[int, str, bool]], max_attempts: int, retry_delay: int, max_retry_delay: int) -> Tuple[List[Tuple], int]:
+    now = int(time.time())
+    errors = {reminder_id: (error, permanent) for reminder_id, error, permanent in failed}
+    failed_ids = list(errors)
+
+    # Пишем только в строки, которые все еще захвачены этим чекером: если
+    # аренда истекла и напоминание перехватил другой чекер, строку не трогаем
+    with conn:
+        conn.executemany('''
+            UPDATE reminders
+            SET is_sent = 1, claimed_by = NULL, claim_expires = NULL
+            WHERE id = ? AND claimed_by = ?
+        ''', [(reminder_id, worker_id) for reminder_id in sent_ids])
+
+        # Повторяющиеся напоминания переносятся на следующее срабатывание
+        conn.executemany('''
+            UPDATE reminders
+            SET remind_time = ?, attempts = 0, next_attempt_at = NULL,
+                claimed_by = NULL, claim_expires = NULL
+            WHERE id = ? AND claimed_by = ?
+        ''', [(remind_time, reminder_id, worker_id) for reminder_id, remind_time in rescheduled])
+
+        # Число попыток читаем в той же транзакции и по нему решаем,
+        # когда повторить отправку, а какие напоминания ее исчерпали
+        attempts = []
+        for offset in range(0, len(failed_ids), IN_QUERY_BATCH):
+            batch = failed_ids[offset:offset + IN_QUERY_BATCH]
+            attempts.extend(conn.execute(f'''
+                SELECT id, attempts, remind_time, recurrence FROM reminders
+                WHERE claimed_by = ? AND id IN ({', '.join('?' * len(batch))})
+            ''', (worker_id, *batch)))
+
+        retries = []
+        dead = []
+        # Повторяющиеся, у которых не удалось отправить одно срабатывание
+        next_occurrences = []
+        for reminder_id, reminder_attempts, remind_time, recurrence in attempts:
+            # Временные ошибки повторяются без ограничения, с задержкой до max_retry_delay
+            permanent = errors[reminder_id][1]
+            if permanent and reminder_attempts + 1 >= max_attempts:
+                dead.append((reminder_id, reminder_attempts + 1))
+                next_time = next_remind_timestamp(recurrence, remind_time) if recurrence else None
+                if next_time is not None:
+                    next_occurrences.append((reminder_id, next_time))
+            else:
+                # Задержка повтора растет экспоненциально
+                delay = min(max_retry_delay, retry_delay * (1 << min(reminder_attempts, 32)))
+                retries.append((reminder_id, now + delay))
+
+        conn.executemany('''
+            UPDATE reminders
+            SET attempts = attempts + 1, next_attempt_at = ?,
+                claimed_by = NULL, claim_expires = NULL
+            WHERE id = ? AND claimed_by = ?
+        ''', [(next_attempt_at, reminder_id, worker_id) for reminder_id, next_attempt_at in retries])
 
-        current_time = datetime.now().isoformat()
+        # Исчерпавшие попытки переносим в dead_reminders. У повторяющегося
+        # туда попадает только неотправленное срабатывание, а сама серия
+        # переносится на следующее, как после успешной отправки
+        conn.executemany('''
+            INSERT OR REPLACE INTO dead_reminders
+                (id, user_id, text, remind_time, created_at, attempts, last_error, failed_at)
+            SELECT id, user_id, text, remind_time, created_at, ?, ?, ?
+            FROM reminders
+            WHERE id = ? AND claimed_by = ?
+        ''', [(reminder_attempts, errors[reminder_id][0], now, reminder_id, worker_id)
+              for reminder_id, reminder_attempts in dead])
+        conn.executemany('''
+            UPDATE reminders
+            SET remind_time = ?, attempts = 0, next_attempt_at = NULL,
+                claimed_by = NULL, claim_expires = NULL
+            WHERE id = ? AND claimed_by = ?
+        ''', [(next_time, reminder_id, worker_id) for reminder_id, next_time in next_occurrences])
+        continued = dict(next_occurrences)
+        conn.executemany(
+            'DELETE FROM reminders WHERE id = ? AND claimed_by = ?',
+            [(reminder_id, worker_id) for reminder_id, _ in dead if reminder_id not in continued]
+        )
+
+    return retries + next_occurrences, len(dead)
+
+
+async def finish_claimed_reminders(worker_id: str, sent_ids: List[int], rescheduled: List[Tuple[int, int]],
+                                   failed: List[Tuple[int, str, bool]],
+                                   max_attempts: int, retry_delay: int, max_retry_delay: int) -> Tuple[List[Tuple], int]:
+    """Одной транзакцией записывает результаты отправки
+
+    Отправленные напоминания помечаются как отправленные, а повторяющиеся из
+    rescheduled — пар (id, remind_time) — переносятся на новое время. Для failed —
+    (id, текст ошибки, постоянная ли ошибка) — откладывается следующая попытка.
+    Если попытка max_attempts закончилась постоянной ошибкой, напоминание
+    переносится в dead_reminders, а временные ошибки повторяются, пока
+    Telegram или сеть не восстановятся. Повторяющееся при этом
+    не удаляется, а переносится на следующее срабатывание.
+    Возвращает список (id, время) напоминаний, которые будут повторены или
+    перенесены, и число срабатываний, перенесенных в dead_reminders.
+    """
+    # Результаты раскладываются по файлам базы и записываются в них параллельно
+    work: Dict[int, Tuple[List, List, List]] = {}
+    for reminder_id in sent_ids:
+        work.setdefault(_shard_for_id(reminder_id).index, ([], [], []))[0].append(_local_id(reminder_id))
+    for reminder_id, remind_time in rescheduled:
+        work.setdefault(_shard_for_id(reminder_id).index, ([], [], []))[1].append((_local_id(reminder_id), remind_time))
+    for reminder_id, error, permanent in failed:
+        work.setdefault(_shard_for_id(reminder_id).index, ([], [], []))[2].append(
+            (_local_id(reminder_id), error, permanent)
+        )
+
+    shards = get_shards()
+    results = await asyncio.gather(*(
+        _run(shards[index], _finish_claimed_reminders, worker_id, *shard_work,
+             max_attempts, retry_delay, max_retry_delay)
+        for index, shard_work in work.items()
+    ))
+
+    retries = []
+    dead_count = 0
+    for index, (shard_retries, shard_dead_count) in zip(work, results):
+        retries.extend(_global_rows(shards[index], shard_retries))
+        dead_count += shard_dead_count
+
+    return retries, dead_count
+
+
+def _get_archivable_reminders(conn: sqlite3.Connection, before: int, limit: int) -> List[Tuple]:
+    return conn.execute(ARCHIVABLE_REMINDERS_QUERY, (before, limit)).fetchall()
+
+
+async def get_archivable_reminders(before: int, limit: int) -> List[Tuple]:
+    """Получает отправленные и удаленные напоминания со временем раньше before
+
+    Возвращает (id, user_id, text, remind_time, created_at, recurrence).
+    """
+    pages = await _run_all(_get_archivable_reminders, before, limit)
+    rows = chain.from_iterable(_global_rows(shard, page) for shard, page in zip(get_shards(), pages))
+
+    return sorted(rows, key=lambda row: row[3])[:limit]
+
+
+def _delete_archived_reminders(conn: sqlite3.Connection, reminder_ids: List[int]) -> int:
+    with conn:
+        cursor = conn.executemany(
+            'DELETE FROM reminders WHERE id = ? AND (is_active = 0 OR is_sent = 1)',
+            [(reminder_id,) for reminder_id in reminder_ids]
+        )
+
+    return cursor.rowcount
+
+
+async def delete_archived_reminders(reminder_ids: List[int]) -> int:
+    """Удаляет из базы перенесенные в архив напоминания, возвращает их число"""
+    local_ids: Dict[int, List[int]] = {}
+    for reminder_id in reminder_ids:
+        local_ids.setdefault(_shard_for_id(reminder_id).index, []).append(_local_id(reminder_id))
+
+    shards = get_shards()
+    deleted = await asyncio.gather(*(
+        _run(shards[index], _delete_archived_reminders, ids) for index, ids in local_ids.items()
+    ))
+
+    return sum(deleted)
+
+
+def _incremental_vacuum(conn: sqlite3.Connection, pages: int) -> int:
+    free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    if not free_pages:
+        return 0
+
+    # Прагма освобождает по странице на каждый шаг выполнения, а execute
+    # делает только один шаг для запроса без колонок — executescript доводит до конца
+    conn.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+
+    return free_pages - conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+async def incremental_vacuum(pages: int) -> int:
+    """Возвращает системе до pages свободных страниц, возвращает сколько освобождено
+
+    В базе без auto_vacuum=INCREMENTAL ничего не делает.
+    """
+    return sum(await _run_all(_incremental_vacuum, pages))
+
+
+def enable_incremental_vacuum():
+    """Включает auto_vacuum=INCREMENTAL в существующей базе
+
+    Требует полного VACUUM, который перезаписывает весь файл и держит
+    блокировку записи, поэтому запускается только при остановленном боте.
+    """
+    for shard in get_shards():
+        conn = shard.get_connection()
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            continue
+
+        print(f"🔧 Включаем incremental vacuum, {shard.path} будет перезаписан...")
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('VACUUM')
+        print(f"✅ Incremental vacuum включен для {shard.path}")
+
+
+def _get_schedule(conn: sqlite3.Connection, limit: int) -> List[Tuple]:
+    return conn.execute(SCHEDULE_QUERY, (limit,)).fetchall()
+
+
+async def get_schedule(limit: int) -> List[Tuple]:
+    """Получает (id, remind_time) ближайших неотправленных напоминаний"""
+    pages = await _run_all(_get_schedule, limit)
+    if len(pages) == 1:
+        return pages[0]
+
+    # Ближайшие limit напоминаний всей базы есть среди ближайших limit каждого файла
+    rows = chain.from_iterable(_global_rows(shard, page) for shard, page in zip(get_shards(), pages))
+    return sorted(rows, key=lambda row: row[1])[:limit]
+
+
+REBALANCE_REMINDER_COLUMNS = (
+    'user_id, text, remind_time, created_at, is_active, is_sent, attempts, next_attempt_at, recurrence'
+)
+REBALANCE_DEAD_COLUMNS = 'user_id, text, remind_time, created_at, attempts, last_error, failed_at'
+
+
+def _copy_table(source: sqlite3.Connection, targets: List[sqlite3.Connection],
+                table: str, columns: str, batch_size: int) -> int:
+    """Копирует строки таблицы в файлы targets по user_id, возвращает их число"""
+    placeholders = ', '.join('?' * len(columns.split(',')))
+    copied = 0
+    last_id = 0
+
+    while True:
+        rows = source.execute(
+            f'SELECT id, {columns} FROM {table} WHERE id > ? ORDER BY id LIMIT ?', (last_id, batch_size)
+        ).fetchall()
+        if not rows:
+            return copied
+
+        last_id = rows[-1][0]
+        batches: Dict[int, List[Tuple]] = {}
+        for row in rows:
+            batches.setdefault(row[1] % len(targets), []).append(row[1:])
+
+        for index, batch in batches.items():
+            with targets[index]:
+                targets[index].executemany(f'INSERT INTO {table} ({columns}) VALUES ({placeholders})', batch)
+        copied += len(rows)
+
+
+def rebalance_shards(old_count: int, new_count: int, batch_size: int = MIGRATION_BATCH_SIZE):
+    """Перераспределяет напоминания из old_count файлов базы в new_count
+
+    Только при остановленных боте и чекере. Напоминания получают новые id,
+    захваты чекеров сбрасываются. Новые файлы сначала пишутся рядом с
+    суффиксом .rebalance и заменяют старые только после полного копирования,
+    старые файлы сохраняются с суффиксом .bak.
+    """
+    old_paths = shard_paths(old_count)
+    new_paths = shard_paths(new_count)
+
+    missing = [path for path in old_paths if not os.path.exists(path)]
+    if missing:
+        raise FileNotFoundError(f"Нет файлов базы: {', '.join(missing)}")
+
+    close_database()
+    temp_paths = [path + '.rebalance' for path in new_paths]
+    for path in temp_paths:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    targets = [open_connection(path) for path in temp_paths]
+    for conn in targets:
+        _create_table(conn)
+
+    moved = 0
+    for path in old_paths:
+        print(f"🔧 Переносим напоминания из {path}...")
+        source = open_connection(path)
+        migrate(source)
+
+        moved += _copy_table(source, targets, 'reminders', REBALANCE_REMINDER_COLUMNS, batch_size)
+        _copy_table(source, targets, 'dead_reminders', REBALANCE_DEAD_COLUMNS, batch_size)
+
+        source.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        source.close()
+
+    # Индексы строим один раз в конце — это быстрее, чем обновлять их на каждую вставку.
+    # Миграции для готовых таблиц сводятся к этому и записи версии схемы
+    for conn in targets:
+        migrate(conn)
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        conn.close()
+
+    for path in old_paths:
+        os.replace(path, path + '.bak')
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    for temp_path, path in zip(temp_paths, new_paths):
+        os.replace(temp_path, path)
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(temp_path + suffix):
+                os.remove(temp_path + suffix)
+
+    print(f"✅ Перенесено напоминаний: {moved}, файлов базы: {new_count}")
+
+
+def test_query_plans():
+    """Проверяет, что основные выборки идут по индексам, а не полным сканом"""
+    conn = sqlite3.connect(':memory:')
+    migrate(conn)
+
+    now = int(time.time())
+    # (запрос, параметры, должен ли индекс быть покрывающим)
+    queries = {
+        'get_active_reminders': (ACTIVE_REMINDERS_QUERY, (1,), True),
+        'get_active_reminders_page (after)': (ACTIVE_REMINDERS_AFTER_QUERY, (1, now, 5, 10), True),
+        'get_active_reminders_page (before)': (ACTIVE_REMINDERS_BEFORE_QUERY, (1, now, 5, 10), True),
+        'get_pending_reminders': (PENDING_REMINDERS_QUERY, (now, now), True),
+        'get_schedule': (SCHEDULE_QUERY, (100,), True),
+        'claim_pending_reminders': (CLAIM_REMINDERS_QUERY, (now, now - 60, 5, now, now, 100), True),
+        'export_reminders_page': (EXPORT_REMINDERS_QUERY, (0, 100), False),
+        'get_archivable_reminders': (ARCHIVABLE_REMINDERS_QUERY, (now, 100), False),
+    }
+
+    print("Проверка планов запросов:")
+    for name, (query, params, covering) in queries.items():
+        plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + query, params)]
+        print(f"{name}: {'; '.join(plan)}")
+
+        assert not any(step == 'SCAN reminders' for step in plan), f"{name}: полный скан таблицы"
+        assert not any('TEMP B-TREE' in step for step in plan), f"{name}: сортировка без индекса"
+        if covering:
+            assert any('COVERING INDEX' in step for step in plan), f"{name}: индекс не покрывающий"
+
+    conn.close()
 
-        cursor.execute('''
-            SELECT id, user_id, text, remind_time 
-            FROM reminders 
-            WHERE remind_time <= ? AND is_active = 1 AND is_sent = 0
-            ORDER BY remind_time
-        ''', (current_time,))
 
-        return cursor.fetchall()
\ No newline at end of file
+if __name__ == '__main__':
+    test_query_plans()
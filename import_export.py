@@ -0,0 +1,504 @@
+"""Потоковый импорт и экспорт напоминаний в CSV и iCalendar
+
+Файлы читаются и пишутся построчно, а напоминания добавляются пачками
+по IMPORT_CHUNK_SIZE строк в одной транзакции, поэтому память не зависит
+от размера файла.
+
+    python import_export.py import reminders.csv
+    python import_export.py import calendar.ics --user-id 123456
+    python import_export.py import reminders.csv --offline
+    python import_export.py export backup.csv
+    python import_export.py export calendar.ics --user-id 123456
+"""
+import argparse
+import asyncio
+import csv
+import logging
+import re
+import time
+from datetime import datetime, timezone
+from itertools import islice
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from database import (
+    init_database, close_database, drop_indexes, create_indexes, insert_reminders,
+    export_reminders_page, get_active_reminders_page, count_active_reminders,
+)
+from time_parser import DEFAULT_RECURRENCE_TIME, parse_time, parse_recurrence_tokens, to_timestamp, from_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк добавлять одной транзакцией
+IMPORT_CHUNK_SIZE = 5000
+# Сколько строк читать из базы за один запрос при экспорте
+EXPORT_PAGE_SIZE = 1000
+# Сколько пропущенных строк выводить в лог, остальные только считаются
+MAX_REPORTED_ERRORS = 20
+
+FORMATS = ('csv', 'ics')
+CSV_FIELDS = ['user_id', 'text', 'remind_time', 'recurrence']
+
+# Правило повторения сохраняется в собственном свойстве, чтобы обратный
+# импорт не зависел от того, выражается ли оно через RRULE
+ICS_RECURRENCE_PROPERTY = 'X-REMINDER-RECURRENCE'
+_ICS_WEEKDAYS = ['SU', 'MO', 'TU', 'WE', 'TH', 'FR', 'SA']
+_ICS_FREQUENCIES = {'WEEKLY': 604800, 'DAILY': 86400, 'HOURLY': 3600, 'MINUTELY': 60}
+_ICS_ESCAPED = re.compile(r'\\([\\;,nN])')
+# Длина строки iCalendar в байтах, длинные строки переносятся
+ICS_LINE_LENGTH = 75
+
+# (user_id, text, remind_time, created_at, recurrence) — как в insert_reminders
+ReminderRow = Tuple[int, str, int, int, Optional[str]]
+
+
+class ImportStats:
+    """Итоги импорта: сколько напоминаний добавлено и сколько строк пропущено"""
+
+    def __init__(self):
+        self.imported = 0
+        self.skipped = 0
+        # Не добавлены, потому что у пользователя уже максимум активных напоминаний
+        self.limited = 0
+        # Чтение файла остановлено на лимите: остальные строки не разбирались
+        self.limit_reached = False
+
+    def add(self, reminder_ids: List[Optional[int]]):
+        """Учитывает результат insert_reminders"""
+        imported = sum(1 for reminder_id in reminder_ids if reminder_id is not None)
+        self.imported += imported
+        self.limited += len(reminder_ids) - imported
+
+    def skip(self, line: int, reason: str):
+        self.skipped += 1
+        if self.skipped <= MAX_REPORTED_ERRORS:
+            logger.warning(f"⚠️ Запись {line} пропущена: {reason}")
+
+
+def detect_format(filename: str) -> Optional[str]:
+    """Определяет формат файла по расширению"""
+    extension = filename.rsplit('.', 1)[-1].lower()
+    return extension if extension in FORMATS else None
+
+
+def _parse_remind_time(value: str) -> Optional[int]:
+    """Разбирает время: epoch секунды, ISO 8601 или формат команды /remind"""
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+
+    try:
+        return to_timestamp(datetime.fromisoformat(value))
+    except ValueError:
+        pass
+
+    parsed = parse_time(value)
+    return to_timestamp(parsed) if parsed else None
+
+
+def _parse_rule(value: str) -> Optional[str]:
+    """Проверяет правило повторения: "every N", "cron ..." или как в /remind"""
+    tokens = value.split()
+    if len(tokens) == 2 and tokens[0] == 'every':
+        return value if tokens[1].isdigit() and int(tokens[1]) > 0 else None
+
+    parsed = parse_recurrence_tokens(tokens)
+    if parsed is None or parsed[2] != len(tokens):
+        return None
+
+    return parsed[0]
+
+
+def read_csv(stream: TextIO, stats: ImportStats, user_id: Optional[int] = None) -> Iterator[ReminderRow]:
+    """Читает напоминания из CSV с колонками user_id, text, remind_time, recurrence
+
+    Если передан user_id, все напоминания достаются ему, а колонка user_id
+    необязательна.
+    """
+    created_at = int(time.time())
+    reader = csv.DictReader(stream)
+
+    for row in reader:
+        try:
+            owner = user_id if user_id is not None else int(row['user_id'])
+        except (KeyError, TypeError, ValueError):
+            stats.skip(reader.line_num, "нет user_id")
+            continue
+
+        text = (row.get('text') or '').strip()
+        if not text:
+            stats.skip(reader.line_num, "пустой текст")
+            continue
+
+        remind_time = _parse_remind_time(row.get('remind_time') or '')
+        if remind_time is None:
+            stats.skip(reader.line_num, f"не распознано время {row.get('remind_time')!r}")
+            continue
+
+        recurrence = (row.get('recurrence') or '').strip() or None
+        if recurrence:
+            rule = _parse_rule(recurrence)
+            if rule is None:
+                stats.skip(reader.line_num, f"не распознано правило повторения {recurrence!r}")
+                continue
+            recurrence = rule
+
+        yield owner, text, remind_time, created_at, recurrence
+
+
+def _unfold(stream: TextIO) -> Iterator[str]:
+    """Склеивает перенесенные строки iCalendar (продолжение начинается с пробела)"""
+    current = None
+    for raw_line in stream:
+        line = raw_line.rstrip('\r\n')
+        if current is not None and line[:1] in (' ', '\t'):
+            current += line[1:]
+            continue
+
+        if current:
+            yield current
+        current = line
+
+    if current:
+        yield current
+
+
+def _unescape(value: str) -> str:
+    return _ICS_ESCAPED.sub(lambda match: '\n' if match.group(1) in 'nN' else match.group(1), value)
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _parse_ics_time(value: str, params: Dict[str, str]) -> Optional[datetime]:
+    """Разбирает DTSTART: UTC (Z), с TZID, локальное время или дату без времени"""
+    try:
+        if params.get('VALUE') == 'DATE' or len(value) == 8:
+            hours, minutes = DEFAULT_RECURRENCE_TIME
+            return datetime.strptime(value[:8], '%Y%m%d').replace(hour=hours, minute=minutes)
+
+        if value.endswith('Z'):
+            utc_time = datetime.strptime(value[:-1], '%Y%m%dT%H%M%S').replace(tzinfo=timezone.utc)
+            return utc_time.astimezone().replace(tzinfo=None)
+
+        local_time = datetime.strptime(value, '%Y%m%dT%H%M%S')
+    except ValueError:
+        return None
+
+    if 'TZID' in params:
+        try:
+            from zoneinfo import ZoneInfo
+            zone_time = local_time.replace(tzinfo=ZoneInfo(params['TZID'].strip('"')))
+            return zone_time.astimezone().replace(tzinfo=None)
+        except (ImportError, ValueError, KeyError):
+            # Неизвестная зона — считаем время локальным
+            pass
+
+    return local_time
+
+
+def _rrule_to_rule(rrule: str, start: datetime) -> Optional[str]:
+    """Переводит RRULE в правило повторения, если оно выражается без ограничений"""
+    parts = dict(part.split('=', 1) for part in rrule.split(';') if '=' in part)
+    freq = parts.get('FREQ')
+    try:
+        interval = int(parts.get('INTERVAL', '1'))
+    except ValueError:
+        return None
+
+    if 'BYDAY' in parts and freq in ('DAILY', 'WEEKLY') and interval == 1 \
+            and set(parts) <= {'FREQ', 'INTERVAL', 'BYDAY', 'WKST'}:
+        days = [day[-2:] for day in parts['BYDAY'].split(',')]
+        if not all(day in _ICS_WEEKDAYS for day in days):
+            return None
+        weekdays = ','.join(str(_ICS_WEEKDAYS.index(day)) for day in days)
+        return f"cron {start.minute} {start.hour} * * {weekdays}"
+
+    # COUNT, UNTIL и остальные BY* в правилах бота не выражаются
+    if set(parts) - {'FREQ', 'INTERVAL', 'WKST'} or freq not in _ICS_FREQUENCIES or interval <= 0:
+        return None
+
+    return f"every {_ICS_FREQUENCIES[freq] * interval}"
+
+
+def _rule_to_rrule(rule: str) -> Optional[str]:
+    """Переводит правило повторения в RRULE для календарей, если это возможно"""
+    kind, _, value = rule.partition(' ')
+    if kind == 'every':
+        seconds = int(value)
+        for freq, length in _ICS_FREQUENCIES.items():
+            if seconds % length == 0:
+                return f"FREQ={freq};INTERVAL={seconds // length}"
+        return None
+
+    minute, hour, day, month, weekday = value.split()
+    if not (minute.isdigit() and hour.isdigit() and day == '*' and month == '*'):
+        return None
+    if weekday == '*':
+        return 'FREQ=DAILY'
+
+    days = set()
+    for part in weekday.split(','):
+        low, _, high = part.partition('-')
+        if not low.isdigit() or not (high or low).isdigit():
+            return None
+        days.update(range(int(low), int(high or low) + 1))
+
+    return 'FREQ=WEEKLY;BYDAY=' + ','.join(_ICS_WEEKDAYS[day % 7] for day in sorted(days))
+
+
+def read_ics(stream: TextIO, stats: ImportStats, user_id: int) -> Iterator[ReminderRow]:
+    """Читает события VEVENT из iCalendar как напоминания пользователя user_id
+
+    Текст берется из SUMMARY, время — из DTSTART, повторение — из
+    X-REMINDER-RECURRENCE (экспорт бота) или RRULE.
+    """
+    created_at = int(time.time())
+    event: Optional[Dict[str, Tuple[str, Dict[str, str]]]] = None
+    nested = 0
+    number = 0
+
+    for line in _unfold(stream):
+        name_params, _, value = line.partition(':')
+        name, *raw_params = name_params.split(';')
+        name = name.upper()
+
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            event, nested = {}, 0
+            number += 1
+        elif event is None:
+            continue
+        elif name == 'BEGIN':
+            # Свойства вложенных компонентов (VALARM) к событию не относятся
+            nested += 1
+        elif name == 'END' and nested:
+            nested -= 1
+        elif name == 'END' and value.upper() == 'VEVENT':
+            row = _build_ics_row(event, user_id, created_at, number, stats)
+            event = None
+            if row:
+                yield row
+        elif not nested:
+            params = dict(param.split('=', 1) for param in raw_params if '=' in param)
+            event[name] = (value, params)
+
+
+def _build_ics_row(event: Dict[str, Tuple[str, Dict[str, str]]], user_id: int, created_at: int,
+                   number: int, stats: ImportStats) -> Optional[ReminderRow]:
+    text = _unescape(event.get('SUMMARY', ('', {}))[0]).strip()
+    if not text:
+        stats.skip(number, "нет SUMMARY")
+        return None
+
+    if 'DTSTART' not in event:
+        stats.skip(number, "нет DTSTART")
+        return None
+
+    start = _parse_ics_time(*event['DTSTART'])
+    if start is None:
+        stats.skip(number, f"не распознано время {event['DTSTART'][0]!r}")
+        return None
+
+    recurrence = None
+    if ICS_RECURRENCE_PROPERTY in event:
+        recurrence = _parse_rule(event[ICS_RECURRENCE_PROPERTY][0])
+    elif 'RRULE' in event:
+        recurrence = _rrule_to_rule(event['RRULE'][0].upper(), start)
+        if recurrence is None:
+            stats.skip(number, f"неподдерживаемое правило {event['RRULE'][0]!r}")
+            return None
+
+    return user_id, text, to_timestamp(start), created_at, recurrence
+
+
+def _read_chunk(rows: Iterator[ReminderRow], size: int) -> List[ReminderRow]:
+    return list(islice(rows, size))
+
+
+async def import_rows(rows: Iterable[ReminderRow], stats: ImportStats, max_active: int = 0,
+                      user_id: Optional[int] = None) -> ImportStats:
+    """Добавляет напоминания пачками, разбирая следующую пачку, пока пишется предыдущая
+
+    Файл разбирается в отдельном потоке, чтобы большой файл не занимал
+    event loop. max_active — лимит активных напоминаний, как в insert_reminders.
+    Если все напоминания принадлежат user_id, свободное место под лимитом
+    читается один раз, и разбор файла останавливается, когда оно закончилось.
+    """
+    rows = iter(rows)
+    remaining: Optional[int] = None
+    if max_active and user_id is not None:
+        remaining = max_active - await count_active_reminders(user_id)
+
+    pending: Optional[asyncio.Future] = None
+    while True:
+        if remaining is not None and remaining <= 0:
+            stats.limit_reached = True
+            break
+
+        size = IMPORT_CHUNK_SIZE if remaining is None else min(IMPORT_CHUNK_SIZE, remaining)
+        chunk = await asyncio.to_thread(_read_chunk, rows, size)
+
+        if pending is not None:
+            stats.add(await pending)
+            pending = None
+        if stats.limited:
+            # Место заняли напоминания, созданные во время импорта
+            stats.limit_reached = True
+            break
+        if not chunk:
+            break
+
+        if remaining is not None:
+            remaining -= len(chunk)
+        pending = asyncio.ensure_future(insert_reminders(chunk, max_active))
+
+    if pending is not None:
+        stats.add(await pending)
+
+    return stats
+
+
+async def import_stream(stream: TextIO, file_format: str, user_id: Optional[int] = None,
+                        max_active: int = 0) -> ImportStats:
+    """Импортирует напоминания из открытого CSV или iCalendar файла"""
+    stats = ImportStats()
+
+    if file_format == 'ics':
+        if user_id is None:
+            raise ValueError("Для импорта iCalendar нужно указать пользователя")
+        rows = read_ics(stream, stats, user_id)
+    else:
+        rows = read_csv(stream, stats, user_id)
+
+    return await import_rows(rows, stats, max_active, user_id)
+
+
+async def iter_reminders(user_id: Optional[int] = None) -> AsyncIterator[Tuple]:
+    """Постранично перебирает активные напоминания пользователя или всех пользователей
+
+    Возвращает (id, user_id, text, remind_time, created_at, recurrence).
+    """
+    if user_id is None:
+        after_id = 0
+        while True:
+            rows = await export_reminders_page(after_id, EXPORT_PAGE_SIZE)
+            for row in rows:
+                yield row
+            if len(rows) < EXPORT_PAGE_SIZE:
+                return
+            after_id = rows[-1][0]
+
+    after = None
+    while True:
+        rows, _, has_next = await get_active_reminders_page(user_id, EXPORT_PAGE_SIZE, after=after)
+        for reminder_id, text, remind_time, created_at, recurrence in rows:
+            yield reminder_id, user_id, text, remind_time, created_at, recurrence
+        if not has_next:
+            return
+        after = (rows[-1][2], rows[-1][0])
+
+
+def _fold(line: str) -> str:
+    """Переносит строку iCalendar длиннее ICS_LINE_LENGTH байт"""
+    if len(line.encode('utf-8')) <= ICS_LINE_LENGTH:
+        return line + '\r\n'
+
+    parts, current, size = [], '', 0
+    for char in line:
+        char_size = len(char.encode('utf-8'))
+        # Строки продолжения начинаются с пробела, он тоже занимает байт
+        if size + char_size > ICS_LINE_LENGTH - (1 if parts else 0):
+            parts.append(current)
+            current, size = '', 0
+        current += char
+        size += char_size
+    parts.append(current)
+
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _ics_time(timestamp: int) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+async def export_stream(stream: TextIO, file_format: str, user_id: Optional[int] = None) -> int:
+    """Записывает активные напоминания в CSV или iCalendar, возвращает их число"""
+    count = 0
+
+    if file_format == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(CSV_FIELDS)
+        async for _, owner, text, remind_time, _, recurrence in iter_reminders(user_id):
+            writer.writerow([owner, text, from_timestamp(remind_time).isoformat(sep=' '), recurrence or ''])
+            count += 1
+        return count
+
+    stream.write('BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//telegram_reminder_bot//RU\r\n')
+    async for reminder_id, owner, text, remind_time, created_at, recurrence in iter_reminders(user_id):
+        lines = [
+            'BEGIN:VEVENT',
+            f'UID:reminder-{reminder_id}-{owner}@telegram-reminder-bot',
+            f'DTSTAMP:{_ics_time(created_at)}',
+            f'DTSTART:{_ics_time(remind_time)}',
+            f'SUMMARY:{_escape(text)}',
+        ]
+        if recurrence:
+            lines.append(f'{ICS_RECURRENCE_PROPERTY}:{recurrence}')
+            rrule = _rule_to_rrule(recurrence)
+            if rrule:
+                lines.append(f'RRULE:{rrule}')
+        lines.append('END:VEVENT')
+
+        stream.write(''.join(_fold(line) for line in lines))
+        count += 1
+    stream.write('END:VCALENDAR\r\n')
+
+    return count
+
+
+async def run_command(args) -> None:
+    file_format = detect_format(args.path)
+    if file_format is None:
+        raise SystemExit(f"❌ Неизвестный формат файла {args.path}, нужен .csv или .ics")
+
+    init_database()
+    started = time.perf_counter()
+    try:
+        if args.command == 'import':
+            if args.offline:
+                drop_indexes()
+            try:
+                with open(args.path, encoding='utf-8-sig', newline='') as stream:
+                    stats = await import_stream(stream, file_format, args.user_id)
+            finally:
+                # Индексы восстанавливаются и после ошибки импорта
+                if args.offline:
+                    print("🔧 Строим индексы...")
+                    create_indexes()
+            print(f"✅ Импортировано {stats.imported} напоминаний, пропущено {stats.skipped} "
+                  f"за {time.perf_counter() - started:.1f} сек.")
+        else:
+            with open(args.path, 'w', encoding='utf-8', newline='') as stream:
+                count = await export_stream(stream, file_format, args.user_id)
+            print(f"✅ Экспортировано {count} напоминаний за {time.perf_counter() - started:.1f} сек.")
+    finally:
+        close_database()
+
+
+def main():
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Импорт и экспорт напоминаний в CSV и iCalendar")
+    parser.add_argument('command', choices=['import', 'export'])
+    parser.add_argument('path', help="файл .csv или .ics")
+    parser.add_argument('--user-id', type=int,
+                        help="пользователь, которому принадлежат напоминания (обязательно для импорта .ics)")
+    parser.add_argument('--offline', action='store_true',
+                        help="бот остановлен: импортировать без индексов и построить их в конце")
+    args = parser.parse_args()
+
+    asyncio.run(run_command(args))
+
+
+if __name__ == '__main__':
+    main()
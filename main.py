@@ -1,32 +1,54 @@
+import asyncio
+import io
 import logging
-from datetime import datetime
-from email.utils import parsedate_to_datetime
-from mimetypes import inited
-from wsgiref.util import application_uri
 
-from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, MessageHandler, ContextTypes, filters
+from telegram.helpers import escape_markdown
 
-from config import BOT_TOKEN
-from database import init_database, add_reminder, get_active_reminders, delete_reminder
-from time_parser import parse_time, format_time
+from config import (
+    BOT_TOKEN, METRICS_PORT, METRICS_HOST, BOT_MODE, CONCURRENT_UPDATES, EMBEDDED_CHECKER, MAX_ACTIVE_REMINDERS,
+    ADMIN_IDS, PROFILE_SECONDS, PROFILE_MAX_SECONDS,
+    WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+)
+from database import (
+    init_database, close_database, add_reminder, get_active_reminders_page, delete_reminder, ReminderLimitError,
+)
+import profiler
+from metrics import instrument_handler, start_metrics_server
+from rate_limiter import rate_limited
+from time_parser import (
+    parse_time_tokens, parse_recurrence_tokens, describe_recurrence, format_time, from_timestamp,
+)
+from tracing import traced, span
 
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO
 )
 
+# Сколько напоминаний показывать на одной странице /list
+LIST_PAGE_SIZE = 10
+# До скольких символов обрезать текст напоминания в списке
+LIST_TEXT_PREVIEW = 200
+# Больше 20 МБ бот не может скачать через Bot API
+IMPORT_MAX_FILE_SIZE = 20 * 1024 * 1024
+
+@traced("start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         '🔔Привет! Я бот для напоминаний!\n\n'
         'Доступные команды:\n'
         '❓ /help - показать справку\n'
         '📝 /remind - создать напоминание\n'
-        '📋 /list - показать активные напоминания\n\n'
+        '🔁 /remind каждый день в 9:00 ... - повторяющееся напоминание\n'
+        '📋 /list - показать активные напоминания\n'
+        '📥 /import, 📤 /export - импорт и экспорт в CSV и iCalendar\n\n'
         'Примеры:\n'
         '• /remind через 30 минут Проверить почту\n'
         '• /remind завтра в 15:00 Встреча с клиентом'
     )
 
+@traced("help")
 async def help_command(update:Update, context: ContextTypes.DEFAULT_TYPE):
     help_text = '''
     🔔 **Бот для напоминаний - Справка**
@@ -35,25 +57,37 @@ async def help_command(update:Update, context: ContextTypes.DEFAULT_TYPE):
     📝 `/remind <время> <текст>` - создать напоминание
     📋 `/list` - показать все активные напоминания  
     🗑 `/delete <номер>` - удалить напоминание по номеру
+    📥 `/import` - загрузить напоминания из файла .csv или .ics
+    📤 `/export [csv|ics]` - выгрузить напоминания в файл
     ❓ `/help` - эта справка
     
     **Форматы времени:**
     ⏰ `через 30 минут` - относительное время
     ⏰ `через 2 часа` - относительное время
+    ⏰ `через час`, `через 3 дня`, `через неделю` - относительное время
     ⏰ `сегодня в 18:00` - время сегодня
     ⏰ `завтра в 09:30` - время завтра  
+    ⏰ `послезавтра в 10:00` - время послезавтра
     ⏰ `15:45` - время сегодня (если не прошло) или завтра
-    ⏰ `2024-06-10 14:30` - точная дата и время
+    ⏰ `2024-06-10 14:30` или `10.06.2024 14:30` - точная дата и время
+
+    **Повторяющиеся напоминания:**
+    🔁 `каждый день в 09:00`, `каждый будний день в 08:30`
+    🔁 `каждый понедельник`, `каждую пятницу в 18:00`
+    🔁 `каждый час`, `каждые 2 часа`, `каждые 3 дня`
+    🔁 `cron 0 9 * * 1-5` - как в crontab
     
     **Примеры:**
     - `/remind через 15 минут Позвонить маме`
     - `/remind завтра в 08:00 Утренняя пробежка`
     - `/remind сегодня в 20:00 Посмотреть фильм`
     - `/remind 2024-06-15 10:00 День рождения друга`
+    - `/remind каждый день в 09:00 Выпить витамины`
     '''
 
     await update.message.reply_text(help_text, parse_mode='Markdown')
 
+@traced("remind")
 async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args: #Если нет аргументов после команды
         await update.message.reply_text(
@@ -62,23 +96,21 @@ async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             parse_mode='Markdown'
         )
         return
-    #Объединяем все слова обратно в строку
-    full_text = ' '.join(context.args)
-
-    words = full_text.split()
+    # Время разбирается за один проход с начала команды, остальное — текст
     reminder_time = None
     reminder_text = ''
+    recurrence = None
 
-    for i in range(2, min(7, len(words) + 1)):
-        time_part = ' '.join(words[:i])
-        text_part = ' '.join(words[i:])
-
-        parsed_time = parse_time(time_part)
-
-        if parsed_time and text_part:
-            reminder_time = parsed_time
-            reminder_text = text_part
-            break
+    with span('parse'):
+        parsed_recurrence = parse_recurrence_tokens(context.args)
+        if parsed_recurrence:
+            recurrence, reminder_time, time_tokens = parsed_recurrence
+            reminder_text = ' '.join(context.args[time_tokens:])
+        else:
+            parsed = parse_time_tokens(context.args)
+            if parsed:
+                reminder_time, time_tokens = parsed
+                reminder_text = ' '.join(context.args[time_tokens:])
 
     if not reminder_time or not reminder_text:
         await update.message.reply_text(
@@ -94,15 +126,26 @@ async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     try:
         # сохраняем напоминание в БД
-        reminder_id = add_reminder(user_id, reminder_text, reminder_time)
+        with span('db'):
+            reminder_id = await add_reminder(user_id, reminder_text, reminder_time, recurrence)
         # форматируем время для показа пользователю
         formatted_time = format_time(reminder_time)
+        repeat_line = f'🔁 **Повтор:** {describe_recurrence(recurrence)}\n' if recurrence else ''
 
+        with span('reply'):
+            await update.message.reply_text(
+                f'✅ Напоминание создано!\n\n'
+                f'📝 **Текст:** {reminder_text}\n'
+                f'⏰ **Время:** {formatted_time}\n'
+                f'{repeat_line}'
+                f'🆔 **ID:** {reminder_id}',
+                parse_mode='Markdown'
+            )
+
+    except ReminderLimitError as e:
         await update.message.reply_text(
-            f'✅ Напоминание создано!\n\n'
-            f'📝 **Текст:** {reminder_text}\n'
-            f'⏰ **Время:** {formatted_time}\n'
-            f'🆔 **ID:** {reminder_id}',
+            f'❌ У вас уже {e.limit} активных напоминаний.\n\n'
+            'Удалите ненужные командой `/delete`, чтобы создать новое.',
             parse_mode='Markdown'
         )
 
@@ -112,29 +155,102 @@ async def remind_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             '❌ Произошла ошибка при создании напоминания. Попробуйте еще раз.'
         )
 
+def render_reminders_page(reminders, has_prev: bool, has_next: bool):
+    """Собирает текст страницы списка и кнопки навигации
+
+    Текст напоминаний экранируется, чтобы разметка одного из них не ломала
+    всю страницу. Напоминания, которые уже не помещаются в одно сообщение,
+    переходят на следующую страницу.
+    """
+    from reminder_checker import MESSAGE_LIMIT, message_length
+
+    lines = ['📋 **Ваши активные напоминания:**\n']
+    # Строки соединяются через \n
+    length = message_length(lines[0]) - 1
+    shown = 0
+
+    for reminder_id, text, remind_timestamp, created_at, recurrence in reminders:
+        formatted_time = from_timestamp(remind_timestamp).strftime("%d.%m.%Y в %H:%M")
+
+        # Длинные тексты обрезаем до экранирования, чтобы не разрезать экранированный символ
+        if len(text) > LIST_TEXT_PREVIEW:
+            text = text[:LIST_TEXT_PREVIEW] + '…'
+
+        reminder_lines = [f"📝 {escape_markdown(text)}", f"   ⏰ {formatted_time}"]
+        if recurrence:
+            reminder_lines.append(f"   🔁 {escape_markdown(describe_recurrence(recurrence))}")
+        reminder_lines.append(f"   🆔 ID: {reminder_id}\n")
+
+        reminder_length = sum(message_length(line) + 1 for line in reminder_lines)
+        if shown and length + reminder_length > MESSAGE_LIMIT:
+            has_next = True
+            break
+
+        lines.extend(reminder_lines)
+        length += reminder_length
+        shown += 1
+
+    reminders = reminders[:shown]
+
+    # В кнопках передаем ключ (remind_time, id) первой и последней строки страницы
+    first_id, _, first_time = reminders[0][:3]
+    last_id, _, last_time = reminders[-1][:3]
+    buttons = []
+    if has_prev:
+        buttons.append(InlineKeyboardButton('⬅️ Назад', callback_data=f'list:prev:{first_time}:{first_id}'))
+    if has_next:
+        buttons.append(InlineKeyboardButton('Вперед ➡️', callback_data=f'list:next:{last_time}:{last_id}'))
+
+    markup = InlineKeyboardMarkup([buttons]) if buttons else None
+    return '\n'.join(lines), markup
+
+@traced("list")
 async def list_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    reminders = get_active_reminders(user_id)
+    with span('db'):
+        reminders, has_prev, has_next = await get_active_reminders_page(user_id, LIST_PAGE_SIZE)
 
     if not reminders:
-        await update.message.reply_text("📭 У вас нет активных напоминаний")
+        with span('reply'):
+            await update.message.reply_text("📭 У вас нет активных напоминаний")
         return
 
-    message_text = '📋 **Ваши активные напоминания:**\n\n'
+    with span('render'):
+        message_text, markup = render_reminders_page(reminders, has_prev, has_next)
+    with span('reply'):
+        await update.message.reply_text(message_text, parse_mode='Markdown', reply_markup=markup)
 
-    for i, (reminder_id, text, reminder_time_str, created_at) in enumerate(reminders, 1):
-#             Конвертируем строку времени обратно в datetime
-#             formatted_time = format_time(remind_time)
-        remind_time = datetime.fromisoformat(reminder_time_str)
-        formatted_time = remind_time.strftime("%d.%m.%Y в %H:%M")
+@traced("list_page")
+async def list_page_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    with span('reply'):
+        await query.answer()
 
-        # Добавляем строку с информацией о напоминании
-        message_text += f"{i}. 📝 {text}\n"
-        message_text += f"   ⏰ {formatted_time}\n"
-        message_text += f"   🆔 ID: {reminder_id}\n\n"
+    _, direction, remind_time, reminder_id = query.data.split(':')
+    key = (int(remind_time), int(reminder_id))
+
+    with span('db'):
+        if direction == 'next':
+            page = await get_active_reminders_page(query.from_user.id, LIST_PAGE_SIZE, after=key)
+        else:
+            page = await get_active_reminders_page(query.from_user.id, LIST_PAGE_SIZE, before=key)
+
+        reminders, has_prev, has_next = page
+        if not reminders:
+            # Напоминания на этой странице успели удалить или отправить
+            reminders, has_prev, has_next = await get_active_reminders_page(query.from_user.id, LIST_PAGE_SIZE)
+
+    if not reminders:
+        with span('reply'):
+            await query.edit_message_text("📭 У вас нет активных напоминаний")
+        return
 
-    await update.message.reply_text(message_text, parse_mode='Markdown')
+    with span('render'):
+        message_text, markup = render_reminders_page(reminders, has_prev, has_next)
+    with span('reply'):
+        await query.edit_message_text(message_text, parse_mode='Markdown', reply_markup=markup)
 
+@traced("delete")
 async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not context.args:
         await update.message.reply_text(
@@ -157,41 +273,235 @@ async def delete_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
 
     try:
-        success = delete_reminder(reminder_id, user_id)
-
-        if success:
-            await update.message.reply_text(
-                f'✅ Напоминание #{reminder_id} удалено!'
-            )
-        else:
-            await update.message.reply_text(
-                f'❌ Напоминание #{reminder_id} не найдено или не принадлежит вам.'
-            )
+        with span('db'):
+            success = await delete_reminder(reminder_id, user_id)
+
+        with span('reply'):
+            if success:
+                await update.message.reply_text(
+                    f'✅ Напоминание #{reminder_id} удалено!'
+                )
+            else:
+                await update.message.reply_text(
+                    f'❌ Напоминание #{reminder_id} не найдено или не принадлежит вам.'
+                )
     except Exception as e:
         logging.error(f"Ошибка при удалении напоминания:{e}")
         await update.message.reply_text(
             '❌ Произошла ошибка при удалении напоминания.'
         )
 
+@traced("import")
+async def import_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(
+        '📥 Отправьте файл .csv или .ics с подписью `/import`\n\n'
+        'Колонки CSV: `text,remind_time,recurrence`, время в формате '
+        '`2024-06-15 10:00` или как в /remind',
+        parse_mode='Markdown'
+    )
+
+@traced("import_file")
+async def import_document(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    from import_export import detect_format, import_stream
+
+    document = update.message.document
+    file_format = detect_format(document.file_name or '')
+
+    if file_format is None:
+        await update.message.reply_text('❌ Поддерживаются только файлы .csv и .ics')
+        return
+    if document.file_size and document.file_size > IMPORT_MAX_FILE_SIZE:
+        await update.message.reply_text('❌ Файл слишком большой, максимум 20 МБ')
+        return
+
+    try:
+        with span('download'):
+            file = await document.get_file()
+            data = await file.download_as_bytearray()
+        # Все напоминания из файла достаются отправителю, колонка user_id игнорируется
+        stream = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8-sig', newline='')
+        # Разбор файла идет вперемешку с записью пачек, поэтому это один этап
+        with span('db'):
+            stats = await import_stream(stream, file_format, update.effective_user.id, MAX_ACTIVE_REMINDERS)
+
+        limited_line = ''
+        if stats.limit_reached or stats.limited:
+            limited_line = (f'\n🚫 Достигнут лимит в {MAX_ACTIVE_REMINDERS} активных напоминаний, '
+                            f'остальные строки файла не импортированы')
+        await update.message.reply_text(
+            f'✅ Импортировано напоминаний: {stats.imported}\n'
+            f'⚠️ Пропущено строк: {stats.skipped}'
+            f'{limited_line}'
+        )
+    except Exception as e:
+        logging.error(f"Ошибка при импорте напоминаний: {e}")
+        await update.message.reply_text(
+            '❌ Не удалось прочитать файл. Проверьте, что он в кодировке UTF-8.'
+        )
+
+@traced("export")
+async def export_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    file_format = context.args[0].lower() if context.args else 'csv'
+    if file_format not in ('csv', 'ics'):
+        await update.message.reply_text(
+            '❌ Формат должен быть csv или ics!\n\n'
+            'Пример: `/export ics`',
+            parse_mode='Markdown'
+        )
+        return
+
+    from import_export import export_stream
+
+    buffer = io.StringIO()
+    with span('db'):
+        count = await export_stream(buffer, file_format, update.effective_user.id)
+
+    if not count:
+        with span('reply'):
+            await update.message.reply_text("📭 У вас нет активных напоминаний")
+        return
+
+    with span('reply'):
+        await update.message.reply_document(
+            document=buffer.getvalue().encode('utf-8'),
+            filename=f'reminders.{file_format}',
+            caption=f'📤 Напоминаний: {count}'
+        )
+
+async def run_profile(update: Update, seconds: int):
+    try:
+        path, samples = await profiler.profile(seconds)
+        with open(path, 'rb') as profile_file:
+            await update.message.reply_document(
+                document=profile_file,
+                filename=path.rsplit('/', 1)[-1],
+                caption=f'📈 Сэмплов: {samples}. Формат collapsed stacks (flamegraph.pl, speedscope)'
+            )
+    except Exception as e:
+        logging.error(f"Ошибка при профилировании: {e}")
+        await update.message.reply_text('❌ Не удалось снять профиль.')
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Для остальных пользователей команды нет
+    if update.effective_user.id not in ADMIN_IDS:
+        return
+
+    try:
+        seconds = int(context.args[0]) if context.args else PROFILE_SECONDS
+    except ValueError:
+        await update.message.reply_text('❌ Длительность должна быть числом секунд!')
+        return
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+
+    if profiler.is_running():
+        await update.message.reply_text('⏳ Профилирование уже идет')
+        return
+
+    await update.message.reply_text(f'🔬 Профилирую {seconds} сек...')
+    # Профиль снимается в фоне, чтобы обработчик не занимал слот на всё время
+    context.application.create_task(run_profile(update, seconds))
+
 def setup_handlers(app: Application):
 
-    app.add_handler(CommandHandler("start", start))
-    app.add_handler(CommandHandler("help", help_command))
-    app.add_handler(CommandHandler("remind", remind_command))
-    app.add_handler(CommandHandler("list", list_command))
-    app.add_handler(CommandHandler("delete", delete_command))
+    commands = {
+        "start": start,
+        "help": help_command,
+        "remind": remind_command,
+        "list": list_command,
+        "delete": delete_command,
+        "import": import_command,
+        "export": export_command,
+        "profile": profile_command,
+    }
+
+    # Все обработчики делят один лимит запросов пользователя
+    for command, handler in commands.items():
+        app.add_handler(CommandHandler(command, instrument_handler(command, rate_limited(command, handler))))
+
+    app.add_handler(CallbackQueryHandler(
+        instrument_handler("list_page", rate_limited("list_page", list_page_callback)), pattern=r'^list:'
+    ))
+    app.add_handler(MessageHandler(
+        filters.Document.ALL & filters.CaptionRegex(r'^/import'),
+        instrument_handler("import_file", rate_limited("import_file", import_document))
+    ))
+
+async def on_startup(app: Application):
+    app.bot_data['metrics_server'] = await start_metrics_server(METRICS_PORT, METRICS_HOST)
+    # kill -USR1 <pid> снимает профиль на PROFILE_SECONDS секунд
+    profiler.install_signal_handler()
+
+    if EMBEDDED_CHECKER:
+        # Импортируются здесь, а не в начале модуля: процессу с отдельным
+        # чекером они не нужны, и запуск бота быстрее
+        from reminder_checker import ReminderChecker
+        from retention import run_retention
+
+        # Чекер работает в том же event loop и отправляет через bot приложения,
+        # а новые напоминания будят его напрямую, без опроса базы
+        checker = ReminderChecker(bot=app.bot)
+        app.bot_data['checker'] = checker
+        app.bot_data['checker_task'] = asyncio.create_task(checker.start_checking(), name="reminder-checker")
+        app.bot_data['retention_task'] = asyncio.create_task(run_retention(), name="retention")
+
+async def on_stop(app: Application):
+    """Останавливает фоновые задачи, пока у bot еще открыт пул соединений"""
+    checker = app.bot_data.get('checker')
+    if checker is not None:
+        await checker.shutdown(app.bot_data['checker_task'])
+
+    retention_task = app.bot_data.get('retention_task')
+    if retention_task is not None:
+        retention_task.cancel()
+        await asyncio.gather(retention_task, return_exceptions=True)
+
+    metrics_server = app.bot_data.get('metrics_server')
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+
+def run_application(app: Application):
+    """Запускает получение обновлений в режиме из BOT_MODE"""
+    if BOT_MODE == 'webhook':
+        if not WEBHOOK_URL:
+            raise RuntimeError("Для режима webhook нужно задать WEBHOOK_URL")
+        if not WEBHOOK_SECRET:
+            raise RuntimeError("Для режима webhook нужно задать WEBHOOK_SECRET")
+
+        print(f"🌐 Принимаем обновления на {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+        app.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=WEBHOOK_SECRET,
+            drop_pending_updates=True,
+        )
+    else:
+        app.run_polling(drop_pending_updates=True)
 
 def main():
 
     init_database()
 
-    app = Application.builder().token(BOT_TOKEN).job_queue(None).build()
+    app = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .job_queue(None)
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_init(on_startup)
+        .post_stop(on_stop)
+        .build()
+    )
 
     setup_handlers(app)
 
     print("🤖 Бот запущен и готов к работе!")
-    print("📝 Доступные команды: /start, /help, /remind, /list, /delete")
-    app.run_polling(drop_pending_updates=True)
+    print("📝 Доступные команды: /start, /help, /remind, /list, /delete, /import, /export")
+    try:
+        run_application(app)
+    finally:
+        close_database()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Метрики отдаются в текстовом формате Prometheus. Запись метрики — это
+# несколько операций со словарем в потоке event loop, без блокировок.
+_registry: List['Metric'] = []
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LATENESS_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60, 300, 900, 3600)
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    kind = ''
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} {self.kind}']
+
+
+class Counter(Metric):
+    """Монотонно растущий счетчик"""
+    kind = 'counter'
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, description, labelnames)
+        self.values: Dict[Tuple, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for key, value in self.values.items():
+            lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {value}')
+        return lines
+
+
+class Gauge(Metric):
+    """Текущее значение, которое может расти и уменьшаться"""
+    kind = 'gauge'
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+    def render(self) -> List[str]:
+        return super().render() + [f'{self.name} {self.value}']
+
+
+class Histogram(Metric):
+    """Распределение значений по корзинам"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, description, labelnames)
+        self.buckets = tuple(buckets)
+        # Для каждого набора меток: счетчики корзин (последняя — +Inf) и сумма
+        self.values: Dict[Tuple, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        if key not in self.values:
+            self.values[key] = ([0] * (len(self.buckets) + 1), [0.0])
+
+        counts, total = self.values[key]
+        counts[bisect_left(self.buckets, value)] += 1
+        total[0] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Измеряет время выполнения блока"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for key, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                labels = _format_labels(self.labelnames, key, 'le="' + le + '"')
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {total[0]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}')
+        return lines
+
+
+REMINDER_LATENESS = Histogram(
+    'reminder_lateness_seconds', 'Опоздание отправки относительно времени напоминания',
+    buckets=LATENESS_BUCKETS
+)
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds', 'Время выполнения запросов к базе', labelnames=('query',)
+)
+SEND_DURATION = Histogram('telegram_send_duration_seconds', 'Время вызова send_message')
+REMINDERS_DISPATCHED = Counter(
+    'reminders_dispatched_total', 'Результаты отправки напоминаний', labelnames=('outcome',)
+)
+PENDING_REMINDERS = Gauge('reminders_pending', 'Наступившие, но еще не отправленные напоминания')
+HANDLER_DURATION = Histogram(
+    'handler_duration_seconds', 'Время обработки команд бота', labelnames=('command',)
+)
+STAGE_DURATION = Histogram(
+    'trace_stage_duration_seconds', 'Время этапов обработчиков и проверки напоминаний', labelnames=('trace', 'stage')
+)
+RATE_LIMITED = Counter(
+    'handler_rate_limited_total', 'Команды, отклоненные из-за лимита запросов пользователя', labelnames=('command',)
+)
+
+
+def render() -> str:
+    """Возвращает все метрики в текстовом формате Prometheus"""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+def instrument_handler(command: str, handler):
+    """Оборачивает обработчик команды, записывая время его выполнения"""
+    @wraps(handler)
+    async def wrapper(update, context):
+        with HANDLER_DURATION.time(command=command):
+            return await handler(update, context)
+
+    return wrapper
+
+
+async def _handle_request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await reader.readline()
+        # Остаток запроса (заголовки) не нужен
+        while (await reader.readline()).strip():
+            pass
+
+        parts = request_line.decode('latin-1').split()
+        if len(parts) >= 2 and parts[1].split('?')[0] == '/metrics':
+            status, body = '200 OK', render().encode('utf-8')
+        else:
+            status, body = '404 Not Found', b'Not Found\n'
+
+        writer.write(
+            f'HTTP/1.1 {status}\r\n'
+            f'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: close\r\n\r\n'.encode('latin-1') + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logger.debug(f"Ошибка при отдаче метрик: {e}")
+    finally:
+        writer.close()
+
+
+async def start_metrics_server(port: int, host: str = '127.0.0.1') -> Optional[asyncio.AbstractServer]:
+    """Запускает HTTP сервер с /metrics, если порт задан"""
+    if not port:
+        return None
+
+    server = await asyncio.start_server(_handle_request, host, port)
+    logger.info(f"📈 Метрики доступны на http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,126 @@
+"""Сэмплирующий профилировщик по запросу
+
+Пока профилировщик выключен, он ничего не стоит: нет ни потока, ни хуков.
+Команда /profile администратора или сигнал SIGUSR1 (kill -USR1 <pid>)
+включают его на PROFILE_SECONDS секунд. Отдельный поток каждые
+PROFILE_INTERVAL секунд снимает стеки всех потоков через
+sys._current_frames(): основного с event loop, потоков базы и остальных.
+
+Результат записывается в PROFILE_DIR в формате collapsed stacks — строка
+"поток;функция (файл:строка);... число_сэмплов". Его читают flamegraph.pl
+и speedscope.
+"""
+import asyncio
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Optional, Set, Tuple
+
+from config import PROFILE_SECONDS, PROFILE_INTERVAL, PROFILE_DIR
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    """Поток, который периодически снимает стеки всех остальных потоков"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+
+        while not self._stop.wait(self.interval):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+
+                self.stacks[';'.join(reversed(stack))] += 1
+
+            self.samples += 1
+
+    def write(self, path: str):
+        """Записывает стеки в формате collapsed stacks, самые частые первыми"""
+        with open(path, 'w', encoding='utf-8') as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f"{stack} {count}\n")
+
+
+_running = False
+# Задачи, запущенные по сигналу, чтобы их не собрал сборщик мусора
+_signal_tasks: Set[asyncio.Task] = set()
+
+
+def is_running() -> bool:
+    return _running
+
+
+async def profile(seconds: float = PROFILE_SECONDS, directory: str = PROFILE_DIR) -> Tuple[str, int]:
+    """Профилирует процесс seconds секунд, возвращает путь к файлу и число сэмплов"""
+    global _running
+    if _running:
+        raise RuntimeError("Профилирование уже запущено")
+
+    _running = True
+    try:
+        logger.info(f"🔬 Профилирование на {seconds} сек.")
+        profiler = SamplingProfiler(PROFILE_INTERVAL)
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await asyncio.to_thread(profiler.stop)
+
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"profile-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.txt")
+        await asyncio.to_thread(profiler.write, path)
+    finally:
+        _running = False
+
+    logger.info(f"📈 Профиль записан в {path}, сэмплов: {profiler.samples}")
+    return path, profiler.samples
+
+
+def install_signal_handler(seconds: float = PROFILE_SECONDS):
+    """Включает профилирование по SIGUSR1 в текущем event loop"""
+    if not hasattr(signal, 'SIGUSR1'):
+        return
+
+    def on_signal():
+        if _running:
+            logger.warning("⚠️ Профилирование уже запущено")
+            return
+        task = asyncio.create_task(profile(seconds), name="profiler")
+        _signal_tasks.add(task)
+        task.add_done_callback(_signal_tasks.discard)
+
+    try:
+        asyncio.get_running_loop().add_signal_handler(signal.SIGUSR1, on_signal)
+    except (NotImplementedError, RuntimeError):
+        # Не основной поток или платформа без сигналов в event loop
+        pass
@@ -0,0 +1,115 @@
+"""Ограничение частоты запросов от одного пользователя
+
+Скользящее окно: пользователь может сделать не больше limit запросов за
+последние window секунд. Память ограничена: хранится не больше max_users
+пользователей, и при переполнении забываются те, кто дольше всех не писал
+боту, — их окно к этому времени обычно уже пустое.
+"""
+import logging
+import time
+from collections import OrderedDict, deque
+from functools import wraps
+from typing import Deque
+
+from config import RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW, RATE_LIMIT_MAX_USERS
+from metrics import RATE_LIMITED
+
+logger = logging.getLogger(__name__)
+
+
+class _UserWindow:
+    __slots__ = ('requests', 'warned_until')
+
+    def __init__(self):
+        # Время разрешенных запросов внутри окна, от старых к новым
+        self.requests: Deque[float] = deque()
+        self.warned_until = 0.0
+
+
+class SlidingWindowLimiter:
+    """Скользящее окно запросов для каждого пользователя с вытеснением давно неактивных"""
+
+    def __init__(self, limit: int, window: float, max_users: int):
+        self.limit = limit
+        self.window = window
+        self.max_users = max_users
+        # Пользователи в порядке последнего запроса, в начале — самые давние
+        self._users: 'OrderedDict[int, _UserWindow]' = OrderedDict()
+
+    def _get_window(self, user_id: int) -> _UserWindow:
+        user_window = self._users.get(user_id)
+        if user_window is None:
+            user_window = self._users[user_id] = _UserWindow()
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+
+        return user_window
+
+    def hit(self, user_id: int) -> float:
+        """Учитывает запрос пользователя
+
+        Возвращает 0, если запрос разрешен, иначе сколько секунд осталось
+        до освобождения места в окне. Отклоненные запросы в окно не попадают.
+        """
+        now = time.monotonic()
+        requests = self._get_window(user_id).requests
+
+        while requests and requests[0] <= now - self.window:
+            requests.popleft()
+
+        if len(requests) >= self.limit:
+            return requests[0] + self.window - now
+
+        requests.append(now)
+        return 0.0
+
+    def should_warn(self, user_id: int, retry_after: float) -> bool:
+        """Предупреждать ли пользователя об ограничении: один раз, пока оно действует"""
+        now = time.monotonic()
+        user_window = self._get_window(user_id)
+        if user_window.warned_until > now:
+            return False
+
+        user_window.warned_until = now + retry_after
+        return True
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+
+limiter = SlidingWindowLimiter(RATE_LIMIT_REQUESTS, RATE_LIMIT_WINDOW, RATE_LIMIT_MAX_USERS)
+
+
+def rate_limited(command: str, handler):
+    """Оборачивает обработчик, отклоняя запросы сверх лимита пользователя
+
+    На отклоненные запросы бот отвечает один раз за время ограничения,
+    чтобы поток сообщений от одного клиента не тратил лимит отправки бота.
+    """
+    if RATE_LIMIT_REQUESTS <= 0:
+        return handler
+
+    @wraps(handler)
+    async def wrapper(update, context):
+        user = update.effective_user
+        if user is None:
+            return await handler(update, context)
+
+        retry_after = limiter.hit(user.id)
+        if not retry_after:
+            return await handler(update, context)
+
+        RATE_LIMITED.inc(command=command)
+        if not limiter.should_warn(user.id, retry_after):
+            return
+
+        logger.warning(f"⏳ Пользователь {user.id} превысил лимит запросов ({command})")
+        text = f'⏳ Слишком много запросов. Попробуйте через {int(retry_after) + 1} сек.'
+        if update.callback_query is not None:
+            await update.callback_query.answer(text)
+        elif update.effective_message is not None:
+            await update.effective_message.reply_text(text)
+
+    return wrapper
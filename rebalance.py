@@ -0,0 +1,32 @@
+"""Перераспределение напоминаний между файлами базы при смене DATABASE_SHARDS
+
+Бот и чекер должны быть остановлены. Например, чтобы перейти с одного
+файла reminders.db на четыре:
+
+    python rebalance.py --from 1 --to 4
+
+и затем запустить бота с DATABASE_SHARDS=4. Напоминания получают новые id,
+старые файлы остаются рядом с суффиксом .bak.
+"""
+import argparse
+import time
+
+from database import rebalance_shards
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Перераспределение напоминаний между файлами базы")
+    parser.add_argument('--from', dest='old_count', type=int, required=True, help="текущее число файлов")
+    parser.add_argument('--to', dest='new_count', type=int, required=True, help="новое число файлов")
+    args = parser.parse_args()
+
+    if args.old_count < 1 or args.new_count < 1:
+        parser.error("число файлов должно быть положительным")
+
+    started = time.perf_counter()
+    rebalance_shards(args.old_count, args.new_count)
+    print(f"⏱ Готово за {time.perf_counter() - started:.1f} сек. Запускайте бота с DATABASE_SHARDS={args.new_count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,75 +1,344 @@
 import asyncio
+import heapq
 import logging
-from datetime import datetime
+import os
+import socket
+import time
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+
 from telegram import Bot
-from telegram.error import TelegramError
+from telegram.error import BadRequest, ChatMigrated, Forbidden, RetryAfter, TelegramError
+from telegram.helpers import escape_markdown
 
-from config import BOT_TOKEN
-from database import get_pending_reminders, delete_reminder
+from config import (
+    BOT_TOKEN, SEND_RATE_LIMIT, SEND_CHAT_INTERVAL, SEND_WORKERS,
+    SEND_MAX_ATTEMPTS, SEND_RETRY_DELAY, SEND_MAX_RETRY_DELAY, METRICS_PORT, METRICS_HOST, DIGEST_WINDOW,
+)
+from database import (
+    claim_pending_reminders, finish_claimed_reminders, close_database, get_schedule,
+    add_schedule_listener, remove_schedule_listener, count_pending_reminders, shard_count, release_claims,
+)
+from retention import run_retention
+from metrics import (
+    REMINDER_LATENESS, SEND_DURATION, REMINDERS_DISPATCHED, PENDING_REMINDERS, start_metrics_server,
+)
+import profiler
+from send_queue import SendQueue
+from time_parser import next_remind_timestamp
+from tracing import traced, span
 
-# Настройка логирования
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Сколько ближайших напоминаний держать в расписании в памяти
+SCHEDULE_PRELOAD = 10000
+
+# На сколько секунд напоминания закрепляются за чекером при захвате
+CLAIM_LEASE_SECONDS = 300
+# Сколько напоминаний захватывать за один запрос
+CLAIM_BATCH_SIZE = 500
+# Сколько ждать завершения начатых отправок при остановке, секунды
+SHUTDOWN_TIMEOUT = 30
+# Максимальная длина сообщения в Telegram, в единицах UTF-16
+MESSAGE_LIMIT = 4096
+
+REMINDER_HEADER = "🔔 **НАПОМИНАНИЕ!**\n\n"
+DIGEST_HEADER = "🔔 **НАПОМИНАНИЯ!**\n"
+
+# Ошибки, которые не пройдут при повторе той же отправки. Только они
+# приближают напоминание к dead_reminders: сбои сети и RetryAfter во время
+# простоя Telegram повторяются, сколько бы он ни длился
+PERMANENT_SEND_ERRORS = (BadRequest, Forbidden, ChatMigrated)
+
+# Напоминание в очереди отправки: (id, текст, remind_time, recurrence)
+Reminder = Tuple[int, str, int, Optional[str]]
+
+
+# Символы, которые escape_markdown экранирует в Markdown первой версии
+_MARKDOWN_SPECIAL = '_*`['
+
+
+def message_length(text: str) -> int:
+    """Длина текста так, как ее считает Telegram: emoji вне BMP занимают две единицы"""
+    return len(text.encode('utf-16-le')) // 2
+
+
+def escape_text(text: str, limit: int) -> str:
+    """Экранирует текст напоминания и обрезает его до limit единиц UTF-16
+
+    Сообщение длиннее MESSAGE_LIMIT Telegram не примет ни с какой попытки,
+    поэтому слишком длинный текст (из импорта или у самой границы лимита
+    /remind) обрезается с многоточием. Режется исходный текст, чтобы не
+    разделить экранированный символ или суррогатную пару.
+    """
+    escaped = escape_markdown(text)
+    if message_length(escaped) <= limit:
+        return escaped
+
+    # Единица оставляется под многоточие
+    length = 0
+    end = 0
+    for end, char in enumerate(text):
+        length += (2 if ord(char) > 0xFFFF else 1) + (char in _MARKDOWN_SPECIAL)
+        if length > limit - 1:
+            break
+
+    return escape_markdown(text[:end]) + '…'
+
 
 class ReminderChecker:
     """Класс для проверки и отправки напоминаний"""
 
-    def __init__(self, bot_token: str):
-        """Инициализация чекера напоминаний"""
+    def __init__(self, bot_token: Optional[str] = None, bot: Optional[Bot] = None):
+        """Инициализация чекера напоминаний
+
+        Чекер в одном процессе с ботом получает его bot, чтобы не открывать
+        второй пул HTTP соединений к Telegram.
+        """
         logger.info("🔧 Инициализация чекера напоминаний...")
-        self.bot = Bot(token=bot_token)
+        self.bot = bot or Bot(token=bot_token)
+        self.send_queue = SendQueue(SEND_RATE_LIMIT, SEND_CHAT_INTERVAL, SEND_WORKERS)
         self.is_running = False
+        # Уникальный идентификатор, под которым чекер захватывает напоминания
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{id(self):x}"
+
+        # Результаты отправки, которые записываются в базу одной транзакцией
+        self._sent_ids: List[int] = []
+        self._rescheduled: List[Tuple[int, int]] = []
+        # Неудачи: (id, текст ошибки, постоянная ли ошибка)
+        self._failed: List[Tuple[int, str, bool]] = []
+        # Запись результатов при остановке, которую не прерывает отмена цикла
+        self._finishing: Optional[asyncio.Future] = None
+
+        # Мин-куча (remind_time, reminder_id) и актуальное время для каждого id.
+        # Удаленные и перенесенные записи остаются в куче и пропускаются лениво
+        self._heap: List[Tuple[int, int]] = []
+        self._scheduled: Dict[int, int] = {}
+        self._schedule_truncated = False
+        self._schedule_changed = asyncio.Event()
         logger.info("✅ Чекер напоминаний инициализирован")
 
-    async def send_reminder(self, user_id: int, text: str, reminder_id: int):
-        """Отправляет напоминание пользователю"""
+    @staticmethod
+    def next_remind_time(recurrence: str, remind_time: int) -> Optional[int]:
+        """Следующее срабатывание повторяющегося напоминания
+
+        Срабатывания, пропущенные пока бот не работал, не догоняются.
+        """
+        return next_remind_timestamp(recurrence, remind_time)
+
+    @staticmethod
+    def build_messages(reminders: List[Reminder]) -> List[Tuple[str, List[Reminder]]]:
+        """Собирает напоминания одного пользователя в сообщения не длиннее MESSAGE_LIMIT
+
+        Возвращает пары (текст сообщения, напоминания в нем). Одно напоминание
+        отправляется в прежнем виде, несколько — списком в одном сообщении.
+        Текст пользователя экранируется: непарная * или _ в одном напоминании
+        не должна ломать разметку всего сообщения. Напоминание, которое не
+        помещается в сообщение даже одно, обрезается.
+        """
+        if len(reminders) == 1:
+            prefix = f"{REMINDER_HEADER}📝 "
+            text = escape_text(reminders[0][1], MESSAGE_LIMIT - message_length(prefix))
+            return [(prefix + text, reminders)]
+
+        messages = []
+        lines: List[str] = []
+        included: List[Reminder] = []
+        header_length = message_length(DIGEST_HEADER)
+        line_limit = MESSAGE_LIMIT - header_length - message_length("\n📝 ")
+        length = header_length
+
+        for reminder in reminders:
+            line = f"\n📝 {escape_text(reminder[1], line_limit)}"
+            line_length = message_length(line)
+            if included and length + line_length > MESSAGE_LIMIT:
+                messages.append((DIGEST_HEADER + ''.join(lines), included))
+                lines, included, length = [], [], header_length
+
+            lines.append(line)
+            included.append(reminder)
+            length += line_length
+
+        messages.append((DIGEST_HEADER + ''.join(lines), included))
+        return messages
+
+    async def send_reminders(self, user_id: int, message: str, reminders: List[Reminder]):
+        """Отправляет пользователю сообщение с одним или несколькими напоминаниями
+
+        Все напоминания сообщения помечаются отправленными вместе.
+        """
+        reminder_ids = [reminder[0] for reminder in reminders]
         try:
-            message = f"🔔 **НАПОМИНАНИЕ!**\n\n📝 {text}"
+            with SEND_DURATION.time():
+                await self.bot.send_message(
+                    chat_id=user_id,
+                    text=message,
+                    parse_mode='Markdown'
+                )
 
-            await self.bot.send_message(
-                chat_id=user_id,
-                text=message,
-                parse_mode='Markdown'
-            )
+            # Помечаем напоминания как отправленные или переносим повторяющиеся
+            now = time.time()
+            for reminder_id, _, remind_time, recurrence in reminders:
+                next_time = self.next_remind_time(recurrence, remind_time) if recurrence else None
+                if next_time is not None:
+                    self._rescheduled.append((reminder_id, next_time))
+                else:
+                    self._sent_ids.append(reminder_id)
+                REMINDER_LATENESS.observe(max(0.0, now - remind_time))
+            REMINDERS_DISPATCHED.inc(len(reminders), outcome='sent')
 
-            # Помечаем напоминание как отправленное
-            delete_reminder(reminder_id, user_id)
+            logger.info(f"✅ Напоминания {reminder_ids} отправлены пользователю {user_id}")
 
-            logger.info(f"✅ Напоминание {reminder_id} отправлено пользователю {user_id}")
+        except RetryAfter:
+            # Паузу и повтор делает очередь отправки
+            raise
 
         except TelegramError as e:
-            logger.error(f"❌ Ошибка отправки напоминания {reminder_id} пользователю {user_id}: {e}")
+            logger.error(f"❌ Ошибка отправки напоминаний {reminder_ids} пользователю {user_id}: {e}")
 
             if "bot was blocked by the user" in str(e).lower():
-                delete_reminder(reminder_id, user_id)
-                logger.info(f"🗑️ Напоминание {reminder_id} удалено - пользователь заблокировал бота")
+                self._sent_ids.extend(reminder_ids)
+                REMINDERS_DISPATCHED.inc(len(reminders), outcome='blocked')
+                logger.info(f"🗑️ Напоминания {reminder_ids} удалены - пользователь заблокировал бота")
+            else:
+                permanent = isinstance(e, PERMANENT_SEND_ERRORS)
+                self._failed.extend((reminder_id, str(e), permanent) for reminder_id in reminder_ids)
+                REMINDERS_DISPATCHED.inc(len(reminders), outcome='failed')
 
         except Exception as e:
-            logger.error(f"❌ Неожиданная ошибка при отправке напоминания {reminder_id}: {e}")
+            logger.error(f"❌ Неожиданная ошибка при отправке напоминаний {reminder_ids}: {e}")
+            self._failed.extend((reminder_id, str(e), False) for reminder_id in reminder_ids)
+            REMINDERS_DISPATCHED.inc(len(reminders), outcome='failed')
+
+    def record_failure(self, reminders: List[Reminder], error: Exception):
+        """Учитывает напоминания, которые очередь отправки так и не смогла отправить
+
+        Они записываются как временные неудачи: повтор назначает
+        finish_claimed_reminders, а не истечение захвата.
+        """
+        self._failed.extend((reminder[0], str(error), False) for reminder in reminders)
+        REMINDERS_DISPATCHED.inc(len(reminders), outcome='failed')
+
+    @staticmethod
+    def group_by_user(pending_reminders: List[Tuple]) -> List[Tuple[int, List[Reminder]]]:
+        """Группирует захваченные напоминания по пользователям в порядке наступления"""
+        if DIGEST_WINDOW < 0:
+            return [
+                (user_id, [(reminder_id, text, remind_time, recurrence)])
+                for reminder_id, user_id, text, remind_time, recurrence in pending_reminders
+            ]
+
+        groups: Dict[int, List[Reminder]] = {}
+        for reminder_id, user_id, text, remind_time, recurrence in pending_reminders:
+            groups.setdefault(user_id, []).append((reminder_id, text, remind_time, recurrence))
+
+        return list(groups.items())
+
+    async def flush_status_updates(self):
+        """Записывает в базу результаты отправки, накопленные за раунд"""
+        if not self._sent_ids and not self._rescheduled and not self._failed:
+            return
+
+        sent_ids, self._sent_ids = self._sent_ids, []
+        rescheduled, self._rescheduled = self._rescheduled, []
+        failed, self._failed = self._failed, []
 
-    async def check_pending_reminders(self):
-        """Проверяет базу данных на наличие напоминаний для отправки"""
         try:
-            logger.debug("🔍 Проверка напоминаний...")
+            retries, dead_count = await finish_claimed_reminders(
+                self.worker_id, sent_ids, rescheduled, failed,
+                SEND_MAX_ATTEMPTS, SEND_RETRY_DELAY, SEND_MAX_RETRY_DELAY
+            )
+            logger.debug(f"💾 Сохранено: отправлено {len(sent_ids)}, не отправлено {len(failed)}")
+        except Exception as e:
+            logger.error(f"❌ Ошибка при сохранении результатов отправки: {e}")
+            # Вернем результаты, чтобы записать их при следующем сохранении
+            self._sent_ids.extend(sent_ids)
+            self._rescheduled.extend(rescheduled)
+            self._failed.extend(failed)
+            return
 
-            # Получаем напоминания для отправки
-            pending_reminders = get_pending_reminders()
+        for reminder_id, remind_time in rescheduled:
+            self.schedule_reminder(reminder_id, remind_time)
 
-            if pending_reminders:
-                logger.info(f"📨 Найдено {len(pending_reminders)} напоминаний для отправки")
+        if dead_count:
+            logger.warning(f"☠️ {dead_count} напоминаний перенесено в dead_reminders после {SEND_MAX_ATTEMPTS} попыток")
 
-                # Создаем задачи для параллельной отправки
-                tasks = []
-                for reminder_id, user_id, text, remind_time in pending_reminders:
-                    logger.info(f"📤 Отправляем напоминание: {text[:50]}... пользователю {user_id}")
-                    task = self.send_reminder(user_id, text, reminder_id)
-                    tasks.append(task)
+        # Ставим повторы в расписание, чтобы проснуться к следующей попытке,
+        # а остальные неудачные убираем из него
+        retry_times = dict(retries)
+        for reminder_id, _, _ in failed:
+            self.schedule_reminder(reminder_id, retry_times.get(reminder_id))
 
-                # Выполняем все задачи параллельно
-                await asyncio.gather(*tasks, return_exceptions=True)
-            else:
+    async def dispatch_shard(self, shard: int):
+        """Захватывает наступившие напоминания одного файла базы и ставит их в очередь"""
+        # (remind_time, id) последнего захваченного напоминания
+        cursor = (-1, -1)
+
+        while self.is_running:
+            # Захватываем напоминания, чтобы другие чекеры их не отправили
+            with span('db'):
+                pending_reminders = await claim_pending_reminders(
+                    self.worker_id, CLAIM_LEASE_SECONDS, CLAIM_BATCH_SIZE, after=cursor, shard=shard
+                )
+
+            if not pending_reminders:
                 logger.debug("📭 Нет напоминаний для отправки")
+                break
+
+            logger.info(f"📨 Захвачено {len(pending_reminders)} напоминаний для отправки")
+
+            # Очередь сама соблюдает лимиты Telegram и ограничивает параллельность.
+            # Когда она заполнена, put ждет, и следующая страница не захватывается.
+            # Напоминания одного пользователя со страницы уходят одним сообщением,
+            # а если оно длиннее лимита — несколькими с интервалом для чата
+            for user_id, reminders in self.group_by_user(pending_reminders):
+                for message, included in self.build_messages(reminders):
+                    if not self.is_running:
+                        # Остальные захваченные напоминания освободятся при остановке
+                        return
+
+                    logger.info(f"📤 Отправляем напоминаний: {len(included)} пользователю {user_id}")
+                    with span('queue'):
+                        await self.send_queue.put(
+                            user_id, partial(self.send_reminders, user_id, message, included),
+                            on_failure=partial(self.record_failure, included)
+                        )
+                    # put не уступает управление, пока в очереди есть место. Уступаем сами,
+                    # чтобы напоминания из разных файлов базы чередовались в очереди
+                    await asyncio.sleep(0)
+
+            # Сохраняем уже завершенные отправки, не дожидаясь всей страницы
+            with span('db'):
+                await self.flush_status_updates()
+
+            if len(pending_reminders) < CLAIM_BATCH_SIZE:
+                break
+
+            last_id, _, _, last_remind_time, _ = pending_reminders[-1]
+            cursor = (last_remind_time, last_id)
+
+    @traced("check_pending_reminders")
+    async def check_pending_reminders(self):
+        """Проверяет базу данных на наличие напоминаний для отправки
+
+        Наступившие напоминания захватываются страницами по CLAIM_BATCH_SIZE
+        и подаются в очередь отправки по мере освобождения места в ней,
+        поэтому память не растет даже при большом накопившемся отставании.
+        Файлы базы обходятся параллельно, и их потоки сливаются в общей очереди.
+        Время этапов db и queue суммируется по всем файлам базы.
+        """
+        try:
+            logger.debug("🔍 Проверка напоминаний...")
+            with span('db'):
+                PENDING_REMINDERS.set(await count_pending_reminders())
+
+            await asyncio.gather(*(self.dispatch_shard(shard) for shard in range(shard_count())))
+
+            with span('send'):
+                await self.send_queue.join()
+            with span('db'):
+                await self.flush_status_updates()
+                PENDING_REMINDERS.set(await count_pending_reminders())
 
         except Exception as e:
             logger.error(f"❌ Ошибка при проверке напоминаний: {e}")
@@ -77,39 +346,100 @@ class ReminderChecker:
             logger.error(f"Трейсбек: {traceback.format_exc()}")
             # НЕ re-raise - продолжаем работу даже при ошибке
 
+    def schedule_reminder(self, reminder_id: int, remind_time: Optional[int]):
+        """Обновляет расписание при добавлении (remind_time) или удалении (None) напоминания"""
+        if remind_time is None:
+            self._scheduled.pop(reminder_id, None)
+        else:
+            self._scheduled[reminder_id] = remind_time
+            heapq.heappush(self._heap, (remind_time, reminder_id))
+
+        # Будим цикл, чтобы он пересчитал время ближайшего напоминания
+        self._schedule_changed.set()
+
+    async def load_schedule(self):
+        """Загружает ближайшие напоминания из базы в расписание"""
+        rows = await get_schedule(SCHEDULE_PRELOAD)
+
+        self._scheduled = {reminder_id: remind_time for reminder_id, remind_time in rows}
+        self._heap = [(remind_time, reminder_id) for reminder_id, remind_time in rows]
+        heapq.heapify(self._heap)
+        self._schedule_truncated = len(rows) >= SCHEDULE_PRELOAD
+
+        logger.debug(f"📅 В расписании {len(rows)} напоминаний")
+
+    def _next_due_time(self) -> Optional[int]:
+        """Возвращает время ближайшего напоминания, выбрасывая устаревшие записи кучи"""
+        while self._heap:
+            remind_time, reminder_id = self._heap[0]
+            if self._scheduled.get(reminder_id) == remind_time:
+                return remind_time
+            heapq.heappop(self._heap)
+
+        return None
+
+    def _pop_due(self, now: float):
+        """Убирает из расписания напоминания, время которых наступило"""
+        while self._heap and self._heap[0][0] <= now:
+            remind_time, reminder_id = heapq.heappop(self._heap)
+            if self._scheduled.get(reminder_id) == remind_time:
+                del self._scheduled[reminder_id]
+
     async def start_checking(self, interval: int = 60):
-        """Запускает бесконечный цикл проверки напоминаний"""
+        """Запускает цикл отправки напоминаний
+
+        Цикл спит до времени ближайшего напоминания и просыпается сразу,
+        когда расписание меняется. Раз в interval секунд расписание сверяется
+        с базой, чтобы подхватить напоминания, добавленные другим процессом.
+        """
         self.is_running = True
-        logger.info(f"🚀 Запуск проверки напоминаний каждые {interval} секунд")
+        logger.info(f"🚀 Запуск отправки напоминаний, сверка с базой каждые {interval} секунд")
         logger.info(f"✅ Флаг is_running установлен в: {self.is_running}")
 
+        add_schedule_listener(self.schedule_reminder)
+
+        cancelled = False
         try:
-            iteration = 0
+            await self.load_schedule()
+            next_sync = time.time() + interval
+
+            # Сразу отправляем то, что просрочено за время простоя
+            await self.check_pending_reminders()
+
             while self.is_running:
-                iteration += 1
-                logger.debug(f"🔄 Итерация #{iteration}, is_running = {self.is_running}")
+                self._schedule_changed.clear()
 
-                # Проверяем напоминания
-                await self.check_pending_reminders()
+                now = time.time()
+                if now >= next_sync or (self._schedule_truncated and not self._heap):
+                    await self.load_schedule()
+                    next_sync = now + interval
 
-                # Проверяем флаг перед ожиданием
-                if not self.is_running:
-                    logger.info("🛑 Получен сигнал остановки")
-                    break
+                # Отправку откладываем на окно дайджеста, чтобы наступившие
+                # за это время напоминания ушли тем же сообщением
+                next_due = self._next_due_time()
+                if next_due is not None:
+                    next_due += max(DIGEST_WINDOW, 0)
+                if next_due is not None and next_due <= now:
+                    self._pop_due(now)
+                    await self.check_pending_reminders()
+                    continue
 
-                # Ждем указанный интервал, но проверяем is_running каждую секунду
-                for i in range(interval):
-                    if not self.is_running:
-                        logger.info(f"🛑 Получен сигнал остановки во время ожидания")
-                        break
-                    await asyncio.sleep(1)
+                timeout = next_sync - now
+                if next_due is not None:
+                    timeout = min(timeout, next_due - now)
+
+                try:
+                    await asyncio.wait_for(self._schedule_changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
 
-                if not self.is_running:
-                    break
+            logger.info("🛑 Получен сигнал остановки")
 
         except asyncio.CancelledError:
             logger.info("🛑 Задача чекера была отменена")
-            self.is_running = False
+            self.stop_checking()
+            cancelled = True
+            raise
         except Exception as e:
             logger.error(f"❌ Критическая ошибка в основном цикле проверки: {e}")
             import traceback
@@ -117,29 +447,74 @@ class ReminderChecker:
             self.is_running = False
             raise  # Re-raise для диагностики
         finally:
-            logger.info("🏁 Чекер напоминаний завершил работу")
+            remove_schedule_listener(self.schedule_reminder)
+            # Дожидаемся начатых отправок и записываем их результаты. Отмена
+            # прерывает только ожидание отправок: без записи результатов и
+            # снятия захвата напоминания ждали бы истечения аренды
+            try:
+                await self.send_queue.close(wait=not cancelled)
+            finally:
+                self._finishing = asyncio.ensure_future(self._save_results())
+                await asyncio.shield(self._finishing)
+
+    async def _save_results(self):
+        """Записывает результаты отправки и снимает захват с оставшихся в очереди,
+        чтобы их сразу подхватил следующий запуск"""
+        await self.flush_status_updates()
+        released = await release_claims(self.worker_id, CLAIM_LEASE_SECONDS)
+        if released:
+            logger.info(f"↩️ Освобождено неотправленных напоминаний: {released}")
+        logger.info("🏁 Чекер напоминаний завершил работу")
 
     def stop_checking(self):
-        """Останавливает проверку напоминаний"""
+        """Останавливает проверку напоминаний
+
+        Начатые отправки завершаются, а еще не начатые выбрасываются из очереди.
+        """
         logger.info("🛑 Получен запрос на остановку чекера")
         self.is_running = False
+        self._schedule_changed.set()
+        self.send_queue.discard_pending()
         logger.info(f"✅ Флаг is_running установлен в: {self.is_running}")
 
+    async def shutdown(self, task: asyncio.Task, timeout: float = SHUTDOWN_TIMEOUT):
+        """Останавливает чекер, запущенный в task, и ждет завершения его цикла
+
+        Если начатые отправки не успели завершиться за timeout секунд,
+        задача отменяется, но результаты все равно записываются в базу.
+        """
+        self.stop_checking()
+        try:
+            await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⏱ Чекер не остановился за {timeout} сек., отменяем")
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            if self._finishing is not None:
+                await self._finishing
+
 
 # Функция для автономного запуска
 async def main():
     """Главная функция для запуска чекера как отдельного процесса"""
     checker = ReminderChecker(BOT_TOKEN)
+    await start_metrics_server(METRICS_PORT, METRICS_HOST)
+    profiler.install_signal_handler()
+    retention_task = asyncio.create_task(run_retention(), name="retention")
 
     try:
-        # Запускаем проверку каждые 30 секунд
+        # Другие процессы не будят чекер, поэтому сверяемся с базой каждые 30 секунд
         await checker.start_checking(interval=30)
     except KeyboardInterrupt:
         logger.info("👋 Программа остановлена пользователем")
     finally:
         checker.stop_checking()
+        retention_task.cancel()
+        await asyncio.gather(retention_task, return_exceptions=True)
+        close_database()
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     # Запускаем асинхронную функцию
     asyncio.run(main())
\ No newline at end of file
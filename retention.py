@@ -0,0 +1,146 @@
+"""Перенос старых отправленных напоминаний в архив
+
+Отправленные и удаленные напоминания старше RETENTION_DAYS дней
+дописываются в CSV файл ARCHIVE_PATH (в формате import_export, поэтому
+их можно загрузить обратно) и удаляются из базы. Освободившиеся страницы
+возвращаются системе через incremental vacuum.
+
+Работа идет маленькими пачками с паузами, поэтому запросы бота и чекера
+успевают выполняться между ними в потоке базы.
+
+    python retention.py                 # один проход
+    python retention.py --enable-vacuum # включить incremental vacuum в старой базе (бот остановлен)
+"""
+import argparse
+import asyncio
+import csv
+import logging
+import os
+import time
+from typing import List, Tuple
+
+from config import RETENTION_DAYS, ARCHIVE_PATH, RETENTION_INTERVAL
+from database import (
+    init_database, close_database, enable_incremental_vacuum,
+    get_archivable_reminders, delete_archived_reminders, incremental_vacuum,
+)
+from import_export import CSV_FIELDS
+from time_parser import from_timestamp
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк переносить за одну транзакцию
+ARCHIVE_BATCH_SIZE = 500
+# Сколько страниц освобождать за один шаг incremental vacuum
+VACUUM_STEP_PAGES = 256
+# Пауза между пачками, чтобы не занимать поток базы надолго
+BATCH_PAUSE = 0.05
+
+ARCHIVE_FIELDS = ['id', *CSV_FIELDS, 'created_at', 'archived_at']
+
+
+def _append_archive(path: str, rows: List[Tuple]):
+    """Дописывает строки в архив и сбрасывает их на диск до удаления из базы"""
+    archived_at = from_timestamp(int(time.time())).isoformat(sep=' ')
+    write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+
+    with open(path, 'a', encoding='utf-8', newline='') as archive:
+        writer = csv.writer(archive)
+        if write_header:
+            writer.writerow(ARCHIVE_FIELDS)
+        for reminder_id, user_id, text, remind_time, created_at, recurrence in rows:
+            writer.writerow([
+                reminder_id, user_id, text, from_timestamp(remind_time).isoformat(sep=' '), recurrence or '',
+                from_timestamp(created_at).isoformat(sep=' '), archived_at,
+            ])
+        archive.flush()
+        os.fsync(archive.fileno())
+
+
+async def archive_old_reminders(retention_days: int, archive_path: str,
+                                batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Переносит в архив напоминания старше retention_days дней, возвращает их число
+
+    Если процесс упадет между записью в файл и удалением из базы,
+    при следующем проходе строки попадут в архив повторно, но не потеряются.
+    """
+    before = int(time.time()) - retention_days * 86400
+    archived = 0
+
+    while True:
+        rows = await get_archivable_reminders(before, batch_size)
+        if not rows:
+            break
+
+        # Запись в файл идет в отдельном потоке, поток базы в это время свободен
+        await asyncio.to_thread(_append_archive, archive_path, rows)
+        archived += await delete_archived_reminders([row[0] for row in rows])
+
+        if len(rows) < batch_size:
+            break
+        await asyncio.sleep(BATCH_PAUSE)
+
+    return archived
+
+
+async def vacuum_free_pages(step_pages: int = VACUUM_STEP_PAGES) -> int:
+    """Освобождает свободные страницы базы по шагам, возвращает их число"""
+    freed = 0
+
+    while True:
+        pages = await incremental_vacuum(step_pages)
+        freed += pages
+        if pages < step_pages:
+            return freed
+        await asyncio.sleep(BATCH_PAUSE)
+
+
+async def run_retention_once(retention_days: int = RETENTION_DAYS, archive_path: str = ARCHIVE_PATH):
+    """Один проход: перенос в архив и incremental vacuum"""
+    if retention_days <= 0:
+        return
+
+    started = time.perf_counter()
+    archived = await archive_old_reminders(retention_days, archive_path)
+    freed = await vacuum_free_pages()
+
+    if archived or freed:
+        logger.info(
+            f"🗄 Перенесено в архив {archived} напоминаний, освобождено {freed} страниц "
+            f"за {time.perf_counter() - started:.1f} сек."
+        )
+
+
+async def run_retention(interval: int = RETENTION_INTERVAL):
+    """Периодически переносит старые напоминания в архив, пока задачу не отменят"""
+    if RETENTION_DAYS <= 0:
+        return
+
+    while True:
+        try:
+            await run_retention_once()
+        except Exception as e:
+            logger.error(f"❌ Ошибка при переносе напоминаний в архив: {e}")
+
+        await asyncio.sleep(interval)
+
+
+async def main(enable_vacuum: bool):
+    init_database()
+    try:
+        if enable_vacuum:
+            enable_incremental_vacuum()
+        await run_retention_once()
+    finally:
+        close_database()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Перенос старых напоминаний в архив")
+    parser.add_argument('--enable-vacuum', action='store_true',
+                        help="включить incremental vacuum в существующей базе (полный VACUUM, бот остановлен)")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.enable_vacuum))
@@ -0,0 +1,236 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from telegram.error import RetryAfter
+
+logger = logging.getLogger(__name__)
+
+# Сколько раз повторять отправку после RetryAfter, прежде чем сдаться и
+# сообщить о неудаче через on_failure
+MAX_FLOOD_RETRIES = 3
+
+
+class TokenBucket:
+    """Ограничивает общую скорость отправки сообщений
+
+    По умолчанию емкость — один токен: сообщения идут ровно с частотой rate.
+    С емкостью rate ведро после простоя выпускает rate сообщений сразу и еще
+    rate за следующую секунду, а Telegram отвечает на это RetryAfter.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Останавливает выдачу токенов, например после RetryAfter от Telegram
+
+        Токены за время паузы не копятся, чтобы после нее не отправить пачку
+        сообщений и не получить следующий RetryAfter.
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated_at = max(self.updated_at, self.paused_until)
+
+    async def acquire(self):
+        """Ждет, пока можно будет отправить одно сообщение"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class SendQueue:
+    """Очередь отправки с ограниченным числом воркеров
+
+    Соблюдает общий лимит сообщений в секунду, интервал между сообщениями
+    в один чат и паузы, которые Telegram запрашивает через RetryAfter.
+
+    Отправки хранятся в очередях своих чатов. Воркер берет чат только
+    тогда, когда его интервал уже прошел, поэтому длинная очередь одного
+    чата не занимает воркеров ожиданием и не задерживает остальные чаты.
+    """
+
+    def __init__(self, rate: float, chat_interval: float, workers: int, max_size: int = 1000):
+        self.bucket = TokenBucket(rate)
+        self.chat_interval = chat_interval
+        self.workers_count = workers
+        self._workers: List[asyncio.Task] = []
+        # Отправки каждого чата в порядке постановки: (send, on_failure)
+        self._pending: Dict[int, Deque[Tuple[Callable[[], Awaitable], Optional[Callable[[Exception], None]]]]] = {}
+        # Чаты, чей интервал прошел и которые ждут свободного воркера
+        self._ready: asyncio.Queue = asyncio.Queue()
+        # Таймеры чатов, которым еще рано писать
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        # Время, раньше которого нельзя писать в чат
+        self._chat_ready_at: Dict[int, float] = {}
+        # Чаты, отправка в которые сейчас идет: следующие их сообщения
+        # планируются только после ее завершения
+        self._sending: Set[int] = set()
+        # Поставленные и еще не завершенные отправки, не больше max_size
+        self._unfinished = 0
+        self._space = asyncio.Semaphore(max_size)
+        self._finished = asyncio.Event()
+        self._finished.set()
+
+    def _ensure_workers(self):
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker(), name=f"send-worker-{i}")
+                for i in range(self.workers_count)
+            ]
+
+    async def put(self, chat_id: int, send: Callable[[], Awaitable],
+                  on_failure: Optional[Callable[[Exception], None]] = None):
+        """Ставит отправку в очередь, ожидая свободного места если очередь заполнена
+
+        on_failure вызывается с ошибкой, если очередь так и не смогла
+        отправить сообщение из-за RetryAfter.
+        """
+        self._ensure_workers()
+        await self._space.acquire()
+        self._unfinished += 1
+        self._finished.clear()
+
+        jobs = self._pending.get(chat_id)
+        if jobs is None:
+            self._pending[chat_id] = deque([(send, on_failure)])
+            # Чат без отправок еще не запланирован — планируем
+            if chat_id not in self._sending:
+                self._schedule_chat(chat_id)
+        else:
+            jobs.append((send, on_failure))
+
+    async def join(self):
+        """Ждет завершения всех поставленных отправок"""
+        await self._finished.wait()
+
+    def discard_pending(self) -> int:
+        """Выбрасывает из очереди еще не начатые отправки, возвращает их число"""
+        discarded = sum(len(jobs) for jobs in self._pending.values())
+        self._pending.clear()
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        while not self._ready.empty():
+            self._ready.get_nowait()
+
+        for _ in range(discarded):
+            self._job_done()
+        return discarded
+
+    async def close(self, wait: bool = True):
+        """Дожидается отправки очереди и останавливает воркеров
+
+        С wait=False или при отмене ожидания воркеры останавливаются,
+        не дожидаясь начатых отправок.
+        """
+        try:
+            if wait and self._workers:
+                await self.join()
+        finally:
+            for worker in self._workers:
+                worker.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            self._workers = []
+
+    def _schedule_chat(self, chat_id: int):
+        """Ставит чат в очередь готовых, как только пройдет его интервал"""
+        delay = self._chat_ready_at.get(chat_id, 0.0) - time.monotonic()
+        if delay <= 0:
+            self._ready.put_nowait(chat_id)
+        else:
+            self._timers[chat_id] = asyncio.get_running_loop().call_later(delay, self._chat_ready, chat_id)
+
+    def _chat_ready(self, chat_id: int):
+        self._timers.pop(chat_id, None)
+        self._ready.put_nowait(chat_id)
+
+    def _take_job(self, chat_id: int):
+        """Забирает следующую отправку чата"""
+        jobs = self._pending.get(chat_id)
+        if not jobs:
+            # Отправки чата выбросил discard_pending
+            return None
+
+        job = jobs.popleft()
+        if not jobs:
+            del self._pending[chat_id]
+        self._sending.add(chat_id)
+        return job
+
+    def _reserve_chat(self, chat_id: int):
+        """Отсчитывает интервал чата от момента, когда сообщение уходит,
+        а не от момента, когда отправка начала ждать общего лимита"""
+        now = time.monotonic()
+        if len(self._chat_ready_at) > 10000:
+            self._chat_ready_at = {chat: ready for chat, ready in self._chat_ready_at.items() if ready > now}
+        self._chat_ready_at[chat_id] = now + self.chat_interval
+
+    def _release_chat(self, chat_id: int):
+        """Планирует следующее сообщение чата после завершения отправки"""
+        self._sending.discard(chat_id)
+        if chat_id in self._pending:
+            self._schedule_chat(chat_id)
+
+    def _job_done(self):
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._finished.set()
+        self._space.release()
+
+    async def _send(self, chat_id: int, send: Callable[[], Awaitable],
+                    on_failure: Optional[Callable[[Exception], None]]):
+        error: Optional[Exception] = None
+        for attempt in range(MAX_FLOOD_RETRIES + 1):
+            await self.bucket.acquire()
+            self._reserve_chat(chat_id)
+            try:
+                await send()
+                return
+            except RetryAfter as e:
+                # Пауза общая: лимит превышен для всего бота, а не для одного чата
+                retry_after = float(e.retry_after)
+                logger.warning(f"⏳ Telegram просит подождать {retry_after} сек. (чат {chat_id})")
+                self.bucket.pause(retry_after)
+                error = e
+
+        logger.error(f"❌ Отправка в чат {chat_id} не удалась после {MAX_FLOOD_RETRIES} повторов")
+        if on_failure is not None:
+            on_failure(error)
+
+    async def _worker(self):
+        while True:
+            chat_id = await self._ready.get()
+            job = self._take_job(chat_id)
+            if job is None:
+                continue
+
+            send, on_failure = job
+            try:
+                await self._send(chat_id, send, on_failure)
+
+            except Exception as e:
+                logger.error(f"❌ Ошибка в очереди отправки для чата {chat_id}: {e}")
+
+            finally:
+                self._release_chat(chat_id)
+                self._job_done()
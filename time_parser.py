@@ -1,18 +1,115 @@
 import re
 from datetime import datetime, timedelta
-from time import strftime
-from typing import Optional
+from typing import List, Optional, Sequence, Set, Tuple
 
 # from six import add_move
 
+# Грамматика времени разбирается одним проходом скомпилированного выражения.
+# Каждая альтернатива — именованная группа, а (?=\s|$) не дает совпасть
+# с частью слова, например "15:450" или "минутами".
+_UNITS = {
+    'минуту': 'minutes', 'минуты': 'minutes', 'минут': 'minutes',
+    'час': 'hours', 'часа': 'hours', 'часов': 'hours',
+    'день': 'days', 'дня': 'days', 'дней': 'days',
+    'неделю': 'weeks', 'недели': 'weeks', 'недель': 'weeks',
+}
+
+_DAYS = {'сегодня': 0, 'завтра': 1, 'послезавтра': 2}
+
+_TIME_GRAMMAR = re.compile(r'''
+    (?:
+        через\s+(?:(?P<amount>\d+)\s+)?(?P<unit>{units})
+      | (?P<day>{days})\s+в\s+(?P<day_hours>[01]?\d|2[0-3]):(?P<day_minutes>[0-5]?\d)
+      | (?P<iso_year>\d{{4}})-(?P<iso_month>\d{{1,2}})-(?P<iso_day>\d{{1,2}})
+        \s+(?P<iso_hours>\d{{1,2}}):(?P<iso_minutes>\d{{1,2}})
+      | (?P<ru_day>\d{{1,2}})\.(?P<ru_month>\d{{1,2}})\.(?P<ru_year>\d{{4}})
+        \s+(?P<ru_hours>\d{{1,2}}):(?P<ru_minutes>\d{{1,2}})
+      | (?P<hours>[01]?\d|2[0-3]):(?P<minutes>[0-5]?\d)
+    )
+    (?=\s|$)
+'''.format(
+    units='|'.join(sorted(_UNITS, key=len, reverse=True)),
+    days='|'.join(sorted(_DAYS, key=len, reverse=True)),
+), re.VERBOSE)
+
+# Самое длинное выражение времени — "через 30 минут", "завтра в 15:00"
+MAX_TIME_TOKENS = 3
+
+
+def _at_time(now: datetime, hours: int, minutes: int) -> datetime:
+    return now.replace(hour=hours, minute=minutes, second=0, microsecond=0)
+
+
+def _build_time(match: 're.Match', now: datetime) -> Optional[datetime]:
+    groups = match.groupdict()
+
+    # 1. "через X минут/часов/дней/недель", "через час"
+    if groups['unit']:
+        amount = int(groups['amount'] or 1)
+        return now + timedelta(**{_UNITS[groups['unit']]: amount})
+
+    # 2. "сегодня/завтра/послезавтра в HH:MM"
+    if groups['day']:
+        target_time = _at_time(now, int(groups['day_hours']), int(groups['day_minutes']))
+        target_time += timedelta(days=_DAYS[groups['day']])
+
+        # "сегодня" в уже прошедшее время означает завтра
+        if groups['day'] == 'сегодня' and target_time <= now:
+            target_time += timedelta(days=1)
+
+        return target_time
+
+    # 3. "YYYY-MM-DD HH:MM" и 4. "DD.MM.YYYY HH:MM"
+    for prefix in ('iso', 'ru'):
+        if groups[f'{prefix}_year']:
+            try:
+                return datetime(
+                    int(groups[f'{prefix}_year']), int(groups[f'{prefix}_month']), int(groups[f'{prefix}_day']),
+                    int(groups[f'{prefix}_hours']), int(groups[f'{prefix}_minutes'])
+                )
+            except ValueError:
+                # Несуществующая дата, например 31.02
+                return None
+
+    # 5. "HH:MM" — сегодня, а если время уже прошло — завтра
+    target_time = _at_time(now, int(groups['hours']), int(groups['minutes']))
+    if target_time <= now:
+        target_time += timedelta(days=1)
+
+    return target_time
+
+
+def parse_time_tokens(tokens: Sequence[str], now: Optional[datetime] = None) -> Optional[Tuple[datetime, int]]:
+    """Разбирает время в начале списка слов
+
+    Args:
+        tokens: Слова команды, например context.args
+        now: Текущее время (для тестов)
+
+    Returns:
+        (datetime, сколько слов заняло время) или None если время не распознано
+    """
+    # Смотрим только на слова, которые может занять время, а не на весь текст
+    head = ' '.join(tokens[:MAX_TIME_TOKENS]).lower()
+    match = _TIME_GRAMMAR.match(head)
+    if not match:
+        return None
+
+    result = _build_time(match, now or datetime.now())
+    if result is None:
+        return None
+
+    return result, match.group(0).count(' ') + 1
+
 
 def parse_time(time_string: str) -> Optional[datetime]:
     """Парсит строку времени и возвращает объект datetime
 
     Поддерживаемые форматы:
-    - "через 30 минут", "через 2 часа"
-    - "завтра в 15:00", "сегодня в 18:30"
-    - "2024-06-10 14:30"
+    - "через 30 минут", "через 2 часа", "через час", "через 3 дня", "через неделю"
+    - "завтра в 15:00", "сегодня в 18:30", "послезавтра в 10:00"
+    - "2024-06-10 14:30", "10.06.2024 14:30"
+    - "15:45"
 
     Args:
         time_string: Строка с описанием времени
@@ -20,82 +117,237 @@ def parse_time(time_string: str) -> Optional[datetime]:
     Returns:
         datetime или None если не удалось распарсить
     """
-    # Приводим к нижнему регистру и убираем лишние пробелы
-    time_string = time_string.lower().strip()
+    tokens = time_string.split()
+    parsed = parse_time_tokens(tokens)
+
+    # Строка должна целиком состоять из времени
+    if parsed is None or parsed[1] != len(tokens):
+        return None
+
+    return parsed[0]
+
+
+# Повторяющиеся напоминания хранятся как правило:
+# "every N" — каждые N секунд, "cron M H DOM MON DOW" — как в crontab
+_WEEKDAYS = {
+    'понедельник': 1, 'вторник': 2, 'среду': 3, 'среда': 3, 'четверг': 4,
+    'пятницу': 5, 'пятница': 5, 'субботу': 6, 'суббота': 6, 'воскресенье': 0,
+}
+_WEEKDAY_DESCRIPTIONS = [
+    'каждое воскресенье', 'каждый понедельник', 'каждый вторник', 'каждую среду',
+    'каждый четверг', 'каждую пятницу', 'каждую субботу',
+]
+
+_RECURRENCE_GRAMMAR = re.compile(r'''
+    (?:
+        каждый\s+день\s+в\s+(?P<daily_hours>[01]?\d|2[0-3]):(?P<daily_minutes>[0-5]?\d)
+      | каждый\s+будний\s+день\s+в\s+(?P<workday_hours>[01]?\d|2[0-3]):(?P<workday_minutes>[0-5]?\d)
+      | кажд(?:ый|ую|ое)\s+(?P<weekday>{weekdays})
+        (?:\s+в\s+(?P<weekday_hours>[01]?\d|2[0-3]):(?P<weekday_minutes>[0-5]?\d))?
+      | кажд(?:ый|ую|ое)\s+(?P<unit>{units})
+      | каждые\s+(?P<amount>\d+)\s+(?P<units>{units})
+      | cron\s+(?P<cron>\S+\s+\S+\s+\S+\s+\S+\s+\S+)
+    )
+    (?=\s|$)
+'''.format(
+    weekdays='|'.join(sorted(_WEEKDAYS, key=len, reverse=True)),
+    units='|'.join(sorted(_UNITS, key=len, reverse=True)),
+), re.VERBOSE)
+
+# Самое длинное правило — "cron 0 9 * * 1-5"
+MAX_RECURRENCE_TOKENS = 6
+
+# Время по умолчанию для "каждый понедельник" без указания часа
+DEFAULT_RECURRENCE_TIME = (9, 0)
+
+# Поля cron: (минимум, максимум)
+_CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+def _parse_cron_field(field: str, low: int, high: int) -> Set[int]:
+    values = set()
+
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step_text = part.split('/', 1)
+            step = int(step_text)
+            if step <= 0:
+                raise ValueError(f"Неверный шаг: {field}")
+
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start_text, end_text = part.split('-', 1)
+            start, end = int(start_text), int(end_text)
+        else:
+            start = end = int(part)
 
-    # Получаем текущее время для расчетов
-    now = datetime.now()
+        if start < low or end > high or start > end:
+            raise ValueError(f"Значение вне диапазона: {field}")
 
-    # 1. Паттерн "через X минут/часов"
-    # re.search ищет паттерн в строке
-    # \d+ означает "одна или более цифр"
-    # (минут|минуты|час|часа|часов) - альтернативы через |
-    relative_pattern = r'через\s+(\d+)\s+(минут|минуты|час|часа|часов)'
-    match = re.search(relative_pattern, time_string)
+        values.update(range(start, end + 1, step))
 
-    if match:
-        amount = int(match.group(1)) # Первая группа в скобках - количество
-        unit = match.group(2) # Вторая группа - единица времени
+    return values
 
-        if unit in ['минут', 'минуты']:
-            delta = timedelta(minutes=amount)
-        elif unit in ['час', 'часа', 'часов']:
-            delta = timedelta(hours=amount)
 
-        return now + delta
+def _parse_cron(expression: str) -> List[Set[int]]:
+    fields = expression.split()
+    if len(fields) != len(_CRON_FIELDS):
+        raise ValueError(f"Нужно {len(_CRON_FIELDS)} полей: {expression}")
 
-    # 2. Паттерн "завтра/сегодня в HH:MM"
-    # \s* означает "ноль или более пробелов"
-    # ([01]?\d|2[0-3]) - часы от 00 до 23
-    # ([0-5]?\d) - минуты от 00 до 59
+    parsed = [_parse_cron_field(field, low, high) for field, (low, high) in zip(fields, _CRON_FIELDS)]
 
-    day_time_pattern = r'(завтра|сегодня)\s+в\s+([01]?\d|2[0-3]):([0-5]?\d)'
-    match = re.search(day_time_pattern, time_string)
+    # 7 в поле дня недели — тоже воскресенье
+    if 7 in parsed[4]:
+        parsed[4] = (parsed[4] - {7}) | {0}
 
-    if match:
-        day = match.group(1)
-        hours = int(match.group(2))
-        minutes = int(match.group(3))
+    return parsed
 
-        target_time = now.replace(hour=hours, minute=minutes, second=0, microsecond=0)
 
-        if day == 'завтра':
-            target_time += timedelta(days=1)
-        elif day == 'сегодня' and target_time <= now:
-            target_time += timedelta(days=1)
+def next_occurrence(rule: str, after: datetime) -> Optional[datetime]:
+    """Возвращает первое срабатывание правила строго после after
 
-        return target_time
+    Returns:
+        datetime или None если правило больше никогда не сработает
+    """
+    kind, _, value = rule.partition(' ')
 
-    # 3. Паттерн "YYYY-MM-DD HH:MM" (точная дата и время)
-    # Пробуем распарсить как полную дату
+    if kind == 'every':
+        return after + timedelta(seconds=int(value))
 
-    try:
-        return datetime.strptime(time_string, '%Y-%m-%d %H:%M')
-    except ValueError:
-        pass # Если не удалось - продолжаем
+    minutes, hours, days, months, weekdays = _parse_cron(value)
+    fields = value.split()
+    # Как в cron: если заданы и день месяца, и день недели, достаточно любого
+    any_day = fields[2] != '*' and fields[4] != '*'
+
+    start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+    day = start.replace(hour=0, minute=0)
+
+    # Перебираем дни, а не минуты: дольше 8 лет правило не ждем (29 февраля)
+    for _ in range(366 * 8):
+        day_matches = day.day in days
+        weekday_matches = (day.weekday() + 1) % 7 in weekdays
+        matches = (day_matches or weekday_matches) if any_day else (day_matches and weekday_matches)
+
+        if day.month in months and matches:
+            for hour in sorted(hours):
+                for minute in sorted(minutes):
+                    candidate = day.replace(hour=hour, minute=minute)
+                    if candidate >= start:
+                        return candidate
+
+        day += timedelta(days=1)
+
+    return None
+
+
+def _build_recurrence(match: 're.Match') -> Optional[str]:
+    groups = match.groupdict()
+
+    if groups['daily_hours']:
+        return f"cron {int(groups['daily_minutes'])} {int(groups['daily_hours'])} * * *"
+
+    if groups['workday_hours']:
+        return f"cron {int(groups['workday_minutes'])} {int(groups['workday_hours'])} * * 1-5"
+
+    if groups['weekday']:
+        hours, minutes = DEFAULT_RECURRENCE_TIME
+        if groups['weekday_hours']:
+            hours, minutes = int(groups['weekday_hours']), int(groups['weekday_minutes'])
+        return f"cron {minutes} {hours} * * {_WEEKDAYS[groups['weekday']]}"
+
+    unit = groups['unit'] or groups['units']
+    if unit:
+        amount = int(groups['amount'] or 1)
+        seconds = int(timedelta(**{_UNITS[unit]: amount}).total_seconds())
+        return f"every {seconds}" if seconds > 0 else None
 
-    # 4. Паттерн "DD.MM.YYYY HH:MM" (российский формат даты)
     try:
-        return datetime.strptime(time_string, '%d.%m.%Y %H:%M')
+        _parse_cron(groups['cron'])
     except ValueError:
-        pass
+        return None
 
-    # 5. Паттерн только "HH:MM" (время сегодня)
-    time_only_pattern = r'^([01]?\d|2[0-3]):([0-5]?\d)$'
-    match = re.match(time_only_pattern, time_string)
+    return f"cron {groups['cron']}"
 
-    if match:
-        hours = int(match.group(1))
-        minutes = int(match.group(2))
 
-        target_time = now.replace(hour=hours, minute=minutes, second=0, microsecond=0)
+def parse_recurrence_tokens(tokens: Sequence[str],
+                            now: Optional[datetime] = None) -> Optional[Tuple[str, datetime, int]]:
+    """Разбирает правило повторения в начале списка слов
 
-        if target_time <= now:
-            target_time +=timedelta(days=1)
+    Поддерживаемые форматы:
+    - "каждый день в 9:00", "каждый будний день в 8:30"
+    - "каждый понедельник", "каждую пятницу в 18:00"
+    - "каждый час", "каждые 2 часа", "каждые 3 дня"
+    - "cron 0 9 * * 1-5"
+
+    Returns:
+        (правило, первое срабатывание, сколько слов заняло правило) или None
+    """
+    head = ' '.join(tokens[:MAX_RECURRENCE_TOKENS]).lower()
+    match = _RECURRENCE_GRAMMAR.match(head)
+    if not match:
+        return None
+
+    rule = _build_recurrence(match)
+    if rule is None:
+        return None
+
+    first = next_occurrence(rule, now or datetime.now())
+    if first is None:
+        return None
+
+    return rule, first, match.group(0).count(' ') + 1
+
+
+def describe_recurrence(rule: str) -> str:
+    """Описывает правило повторения для пользователя"""
+    kind, _, value = rule.partition(' ')
+
+    if kind == 'every':
+        seconds = int(value)
+        for unit_seconds, unit_name in ((604800, 'нед.'), (86400, 'дн.'), (3600, 'ч.'), (60, 'мин.')):
+            if seconds % unit_seconds == 0:
+                return f"каждые {seconds // unit_seconds} {unit_name}"
+        return f"каждые {seconds} сек."
+
+    fields = value.split()
+    if fields[0].isdigit() and fields[1].isdigit() and fields[2] == fields[3] == '*':
+        at = f"{int(fields[1]):02d}:{int(fields[0]):02d}"
+        if fields[4] == '*':
+            return f"каждый день в {at}"
+        if fields[4] == '1-5':
+            return f"по будням в {at}"
+        if fields[4].isdigit():
+            return f"{_WEEKDAY_DESCRIPTIONS[int(fields[4]) % 7]} в {at}"
+
+    return f"cron {value}"
+
+
+def to_timestamp(dt: datetime) -> int:
+    """Переводит локальное время в UTC epoch секунды для хранения в базе"""
+    return int(dt.timestamp())
+
+
+def from_timestamp(timestamp: int) -> datetime:
+    """Переводит UTC epoch секунды из базы в локальное время"""
+    return datetime.fromtimestamp(timestamp)
+
+
+def next_remind_timestamp(rule: str, remind_time: int) -> Optional[int]:
+    """Следующее срабатывание правила после remind_time в UTC epoch секундах
+
+    Срабатывания, пропущенные пока бот не работал, не догоняются.
+    None — правило больше никогда не сработает.
+    """
+    next_time = next_occurrence(rule, from_timestamp(remind_time))
+    now = datetime.now()
+    if next_time is not None and next_time <= now:
+        next_time = next_occurrence(rule, now)
+
+    return to_timestamp(next_time) if next_time else None
 
-        return target_time
 
-    return None
 # Форматируем datetime в читаемую строку
 def format_time(dt: datetime) -> str:
 
@@ -108,28 +360,77 @@ def format_time(dt: datetime) -> str:
         return f"завтра в {dt.strftime('%H:%M')}"
 
     else:
-        return strftime('%d.%m.%Y в %H:%M')
+        return dt.strftime('%d.%m.%Y в %H:%M')
+
+
+# Общий набор примеров: (слова, ожидаемое время от NOW, сколько слов заняло время)
+TEST_NOW = datetime(2024, 6, 10, 12, 0)
+TEST_CORPUS = [
+    ("через 30 минут", datetime(2024, 6, 10, 12, 30), 3),
+    ("через 1 минуту позвонить", datetime(2024, 6, 10, 12, 1), 3),
+    ("через 2 часа", datetime(2024, 6, 10, 14, 0), 3),
+    ("через 5 часов", datetime(2024, 6, 10, 17, 0), 3),
+    ("через час выпить воды", datetime(2024, 6, 10, 13, 0), 2),
+    ("через 3 дня", datetime(2024, 6, 13, 12, 0), 3),
+    ("через неделю", datetime(2024, 6, 17, 12, 0), 2),
+    ("завтра в 15:00 встреча", datetime(2024, 6, 11, 15, 0), 3),
+    ("сегодня в 18:30", datetime(2024, 6, 10, 18, 30), 3),
+    ("сегодня в 09:30", datetime(2024, 6, 11, 9, 30), 3),
+    ("послезавтра в 7:05", datetime(2024, 6, 12, 7, 5), 3),
+    ("Завтра в 8:00 Пробежка", datetime(2024, 6, 11, 8, 0), 3),
+    ("2024-06-15 14:30 день рождения", datetime(2024, 6, 15, 14, 30), 2),
+    ("15.06.2024 10:00", datetime(2024, 6, 15, 10, 0), 2),
+    ("15:45 чай", datetime(2024, 6, 10, 15, 45), 1),
+    ("11:00", datetime(2024, 6, 11, 11, 0), 1),
+    ("31.02.2024 10:00", None, 0),
+    ("25:00 текст", None, 0),
+    ("через 30 минутами", None, 0),
+    ("проверить почту", None, 0),
+]
+
+# (слова, ожидаемое правило, первое срабатывание от TEST_NOW, сколько слов заняло правило)
+RECURRENCE_CORPUS = [
+    ("каждый день в 9:00 зарядка", "cron 0 9 * * *", datetime(2024, 6, 11, 9, 0), 4),
+    ("каждый день в 18:30", "cron 30 18 * * *", datetime(2024, 6, 10, 18, 30), 4),
+    ("каждый будний день в 8:00", "cron 0 8 * * 1-5", datetime(2024, 6, 11, 8, 0), 5),
+    ("каждый понедельник планерка", "cron 0 9 * * 1", datetime(2024, 6, 17, 9, 0), 2),
+    ("каждую пятницу в 18:00", "cron 0 18 * * 5", datetime(2024, 6, 14, 18, 0), 4),
+    ("каждое воскресенье в 10:00", "cron 0 10 * * 0", datetime(2024, 6, 16, 10, 0), 4),
+    ("каждый час", "every 3600", datetime(2024, 6, 10, 13, 0), 2),
+    ("каждые 2 часа пить воду", "every 7200", datetime(2024, 6, 10, 14, 0), 3),
+    ("каждые 3 дня", "every 259200", datetime(2024, 6, 13, 12, 0), 3),
+    ("cron 0 9 1 * * счета", "cron 0 9 1 * *", datetime(2024, 7, 1, 9, 0), 6),
+    ("cron */15 * * * *", "cron */15 * * * *", datetime(2024, 6, 10, 12, 15), 6),
+    ("cron 0 0 29 2 *", "cron 0 0 29 2 *", datetime(2028, 2, 29, 0, 0), 6),
+    ("cron 0 0 31 2 *", None, None, 0),
+    ("cron 61 * * * *", None, None, 0),
+    ("через 30 минут", None, None, 0),
+]
+
 
 def test_parser():
     """Тестовая функция для проверки работы парсера"""
-    test_cases = [
-        "через 30 минут",
-        "через 2 часа",
-        "завтра в 15:00",
-        "сегодня в 18:30",
-        "2024-06-10 14:30",
-        "15:45"
-    ]
-
     print("Тестирование парсера времени:")
-    for case in test_cases:
-        result = parse_time(case)
+    for case, expected, expected_tokens in TEST_CORPUS:
+        result = parse_time_tokens(case.split(), now=TEST_NOW)
+        if result:
+            print(f"'{case}' -> {result[0].strftime('%d.%m.%Y %H:%M')} ({result[1]} сл.)")
+        else:
+            print(f"'{case}' -> НЕ РАСПОЗНАНО")
+
+        assert result == ((expected, expected_tokens) if expected else None), case
+
+    print("Тестирование правил повторения:")
+    for case, expected_rule, expected_first, expected_tokens in RECURRENCE_CORPUS:
+        result = parse_recurrence_tokens(case.split(), now=TEST_NOW)
         if result:
-            formatted = format_time(result)
-            print(f"'{case}' -> {formatted}")
+            print(f"'{case}' -> {describe_recurrence(result[0])}, первый раз {result[1].strftime('%d.%m.%Y %H:%M')}")
         else:
             print(f"'{case}' -> НЕ РАСПОЗНАНО")
 
+        expected = (expected_rule, expected_first, expected_tokens) if expected_rule else None
+        assert result == expected, case
+
 
 if __name__ == '__main__':
-    test_parser()
\ No newline at end of file
+    test_parser()
@@ -0,0 +1,73 @@
+"""Трассировка этапов обработчиков: разбор команды, база, ответ
+
+Обработчик, обернутый в traced(name), открывает трассу, а участки его кода
+в with span('db'): ... записывают в нее свое время. По завершении время
+каждого этапа попадает в метрику trace_stage_duration_seconds, а трассы
+дольше TRACE_SLOW_MS миллисекунд пишутся в лог с разбивкой по этапам.
+Время, не покрытое этапами, записывается как 'other'.
+
+Вне трассы span ничего не делает, поэтому вспомогательные функции можно
+размечать, не заботясь о том, откуда их вызовут. Задачи, запущенные внутри
+трассы, пишут в нее же: этапы параллельных задач суммируются.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Dict, Optional
+
+from config import TRACE_SLOW_MS
+from metrics import STAGE_DURATION
+
+logger = logging.getLogger(__name__)
+
+# Время этапов текущей трассы, секунды
+_current_trace: ContextVar[Optional[Dict[str, float]]] = ContextVar('trace', default=None)
+
+
+@contextmanager
+def span(stage: str):
+    """Записывает время блока в этап stage текущей трассы"""
+    stages = _current_trace.get()
+    if stages is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages[stage] = stages.get(stage, 0.0) + time.perf_counter() - started
+
+
+def _finish(name: str, stages: Dict[str, float], total: float):
+    other = total - sum(stages.values())
+    if other > 0:
+        stages['other'] = other
+
+    for stage, seconds in stages.items():
+        STAGE_DURATION.observe(seconds, trace=name, stage=stage)
+
+    if TRACE_SLOW_MS and total * 1000 >= TRACE_SLOW_MS:
+        breakdown = ', '.join(f"{stage} {seconds * 1000:.0f} мс" for stage, seconds in stages.items())
+        logger.info(f"🐢 {name}: {total * 1000:.0f} мс ({breakdown})")
+
+
+def traced(name: str):
+    """Декоратор корутины, открывающий трассу с именем name"""
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, **kwargs):
+            stages: Dict[str, float] = {}
+            token = _current_trace.set(stages)
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                _current_trace.reset(token)
+                _finish(name, stages, time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator